@@ -1,18 +1,281 @@
 import sqlite3
 import json
-import time
 import base64
+import io
 import os
+import secrets
+import threading
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from pathlib import Path
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 优先使用orjson（C实现，序列化/解析更快），未安装时回退到标准库json
+try:
+    import orjson
+
+    def _dumps(value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    _loads = json.loads
+
+# API密钥加解密优先使用rfernet（Rust实现，令牌格式与cryptography的Fernet兼容），未安装时回退
+try:
+    import rfernet
+
+    class Fernet:
+        """将rfernet的str接口适配为cryptography.fernet.Fernet的bytes接口"""
+        
+        __slots__ = ('_fernet',)
+        
+        def __init__(self, key: bytes):
+            self._fernet = rfernet.Fernet(key.decode())
+        
+        def encrypt(self, data: bytes) -> bytes:
+            return self._fernet.encrypt(data).encode()
+        
+        def decrypt(self, token: bytes) -> bytes:
+            return self._fernet.decrypt(token.decode())
+except ImportError:
+    from cryptography.fernet import Fernet
+
+# JSON列在查询中以 "列名 [JSON]" 标注，由sqlite3在C层取值时直接调用转换器解析
+sqlite3.register_converter("JSON", _loads)
+
+
+def _to_json(value: Any) -> Optional[str]:
+    """将文档信息/来源序列化为紧凑JSON（空值存为NULL）"""
+    return _dumps(value) if value else None
+
+
+_MISSING = object()
+
+
+class _LazyJSON:
+    """延迟解析的JSON字段：首次调用 value() 时才解析，结果随缓存的会话行复用"""
+    
+    __slots__ = ('raw', '_v')
+    
+    def __init__(self, raw: Optional[str]):
+        self.raw = raw
+        self._v = _MISSING
+    
+    def value(self) -> Any:
+        if self._v is _MISSING:
+            self._v = _loads(self.raw) if self.raw else None
+        return self._v
+    
+    def __bool__(self) -> bool:
+        return bool(self.raw)
+    
+    def __repr__(self) -> str:
+        return f"_LazyJSON({self.raw!r})"
+
+
+class _MessageBatch:
+    """batch() 返回的消息收集器：写入先暂存在内存中，退出上下文时一次性提交"""
+    
+    __slots__ = ('messages', 'message_ids')
+    
+    def __init__(self):
+        self.messages: List[Tuple[str, str, str, Optional[float], Optional[List[str]]]] = []
+        self.message_ids: List[int] = []
+    
+    def add_message(self, session_id: str, role: str, content: str, processing_time: float = None,
+                    document_sources: List[str] = None) -> None:
+        self.messages.append((session_id, role, content, processing_time, document_sources))
+
+
+def _row_dicts(cursor: sqlite3.Cursor, rows: List[tuple]) -> List[Dict[str, Any]]:
+    """按列名把元组行直接组装为字典（不经过sqlite3.Row中转，每行只分配一次）"""
+    fields = [column[0] for column in cursor.description]
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _like_escape(query: str) -> str:
+    """转义LIKE通配符，使用户输入的 % 和 _ 按字面匹配"""
+    return query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# 解密后API密钥缓存的最大用户数
+_API_KEY_CACHE_SIZE = 256
+
+# 数据库结构版本（记录在 PRAGMA user_version 中）；修改表结构、索引或触发器时递增
+_SCHEMA_VERSION = 1
+
+_SQL_CREATE_MESSAGES = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        role TEXT,  -- 'user' 或 'assistant'
+        content TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        processing_time REAL,  -- 处理时间（秒）
+        document_sources TEXT,  -- JSON格式存储相关文档来源
+        FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id) ON DELETE CASCADE
+    )
+"""
+
+# 热点SQL语句：提升为模块级常量，同一字符串对象可稳定命中sqlite3的语句缓存
+_SQL_INSERT_MSG = """
+    INSERT INTO chat_messages (session_id, role, content, processing_time, document_sources)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_SQL_INSERT_MSG_RETURNING = _SQL_INSERT_MSG.rstrip() + " RETURNING id"
+
+_SQL_SEL_MSGS = """
+    SELECT id, role, content, timestamp, processing_time,
+           document_sources AS "document_sources [JSON]"
+    FROM chat_messages 
+    WHERE session_id = ? 
+    ORDER BY timestamp, id 
+    LIMIT ?
+"""
+
+_SQL_SEL_RECENT = """
+    SELECT s.session_id, s.user_id, s.session_name, s.created_at, s.updated_at,
+           s.document_info,
+           json_extract(s.document_info, '$.file_name') AS file_name,
+           s.vector_store_type, s.message_count, u.username, u.name as user_name
+    FROM chat_sessions s
+    LEFT JOIN users u ON s.user_id = u.user_id
+    ORDER BY s.updated_at DESC
+    LIMIT ?
+"""
+
+_SQL_SEL_RECENT_BY_USER = """
+    SELECT s.session_id, s.user_id, s.session_name, s.created_at, s.updated_at,
+           s.document_info,
+           json_extract(s.document_info, '$.file_name') AS file_name,
+           s.vector_store_type, s.message_count, u.username, u.name as user_name
+    FROM chat_sessions s
+    LEFT JOIN users u ON s.user_id = u.user_id
+    WHERE s.user_id = ?
+    ORDER BY s.updated_at DESC
+    LIMIT ?
+"""
+
+_SQL_DEL_SESSION = "DELETE FROM chat_sessions WHERE session_id = ?"
+
+_SQL_EXPORT_JSON = """
+    SELECT json_object(
+        'session_info', json_object(
+            'session_id', s.session_id,
+            'user_id', s.user_id,
+            'session_name', s.session_name,
+            'created_at', s.created_at,
+            'updated_at', s.updated_at,
+            'document_info', json(s.document_info),
+            'vector_store_type', s.vector_store_type,
+            'message_count', s.message_count
+        ),
+        'messages', (
+            SELECT json_group_array(json(msg)) FROM (
+                SELECT json_object(
+                    'id', m.id,
+                    'role', m.role,
+                    'content', m.content,
+                    'timestamp', m.timestamp,
+                    'processing_time', m.processing_time,
+                    'document_sources', json(m.document_sources)
+                ) AS msg
+                FROM chat_messages m
+                WHERE m.session_id = s.session_id
+                ORDER BY m.timestamp, m.id
+            )
+        ),
+        'exported_at', ?
+    )
+    FROM chat_sessions s
+    WHERE s.session_id = ?
+"""
+
+# 文本导出：时间戳在SQL中格式化，Python侧无需逐条解析
+_SQL_EXPORT_TXT_MSGS = """
+    SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp) AS ts_fmt, role, content, processing_time
+    FROM chat_messages
+    WHERE session_id = ?
+    ORDER BY timestamp, id
+"""
+
+# 消息搜索：按范围（全部/指定会话/指定用户）预先生成SQL
+_SEARCH_SCOPES = {
+    'all': "",
+    'session': " AND m.session_id = ?",
+    'user': " AND s.user_id = ?",
+}
+
+# 全文索引命中时按BM25相关度排序，相关度相同的按时间倒序；LIKE回退只按时间倒序
+_SQL_SEARCH_FTS = {
+    scope: f"""
+    SELECT m.id, m.session_id, m.role, m.content, m.timestamp, m.processing_time,
+           m.document_sources AS "document_sources [JSON]", s.session_name, s.user_id,
+           snippet(chat_messages_fts, 0, '**', '**', '…', 32) AS content_snippet
+    FROM chat_messages_fts
+    JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+    JOIN chat_sessions s ON m.session_id = s.session_id
+    WHERE chat_messages_fts MATCH ?{condition}
+    ORDER BY bm25(chat_messages_fts), m.timestamp DESC
+    LIMIT ?
+"""
+    for scope, condition in _SEARCH_SCOPES.items()
+}
+
+_SQL_SEARCH_LIKE = {
+    scope: f"""
+    SELECT m.id, m.session_id, m.role, m.content, m.timestamp, m.processing_time,
+           m.document_sources AS "document_sources [JSON]", s.session_name, s.user_id,
+           NULL AS content_snippet
+    FROM chat_messages m
+    JOIN chat_sessions s ON m.session_id = s.session_id
+    WHERE m.content LIKE ? ESCAPE '\\'{condition}
+    ORDER BY m.timestamp DESC
+    LIMIT ?
+"""
+    for scope, condition in _SEARCH_SCOPES.items()
+}
+
+# 搜索结果预览：只返回显示所需的列，正文在SQL中截取，不传输完整消息
+_SQL_SEARCH_PREVIEW_FTS = {
+    scope: f"""
+    SELECT m.role, m.timestamp, s.session_name,
+           snippet(chat_messages_fts, 0, '**', '**', '…', 32) AS preview
+    FROM chat_messages_fts
+    JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+    JOIN chat_sessions s ON m.session_id = s.session_id
+    WHERE chat_messages_fts MATCH ?{condition}
+    ORDER BY bm25(chat_messages_fts), m.timestamp DESC
+    LIMIT ?
+"""
+    for scope, condition in _SEARCH_SCOPES.items()
+}
+
+_SQL_SEARCH_PREVIEW_LIKE = {
+    scope: f"""
+    SELECT m.role, m.timestamp, s.session_name,
+           substr(m.content, 1, ?) || CASE WHEN length(m.content) > ? THEN '...' ELSE '' END AS preview
+    FROM chat_messages m
+    JOIN chat_sessions s ON m.session_id = s.session_id
+    WHERE m.content LIKE ? ESCAPE '\\'{condition}
+    ORDER BY m.timestamp DESC
+    LIMIT ?
+"""
+    for scope, condition in _SEARCH_SCOPES.items()
+}
+
 class ChatHistoryDB:
     """聊天历史数据库管理类"""
     
@@ -31,8 +294,63 @@ class ChatHistoryDB:
         self._encryption_key = self._get_encryption_key()
         self._cipher = Fernet(self._encryption_key)
         
+        # 长连接：整个实例共用一个连接，避免每次调用重新打开数据库
+        self._lock = threading.RLock()
+        # cached_statements：扩大预编译语句缓存，热点查询无需重复解析SQL
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, detect_types=sqlite3.PARSE_COLNAMES,
+                                     cached_statements=256)
+        self._configure_connection(self._conn)
+        
+        # 读缓存：键中包含版本号，本实例写入时递增版本号使相关缓存失效
+        self._session_versions: Dict[str, int] = {}
+        self._sessions_version = 0
+        self._messages_cache = lru_cache(maxsize=128)(self._fetch_session_messages)
+        self._sessions_cache = lru_cache(maxsize=32)(self._fetch_recent_sessions)
+        # 解密后的API密钥缓存（LRU）：user_id -> (data_version, api_key)，本实例更新密钥时直接移除
+        self._api_key_cache: "OrderedDict[int, Tuple[int, Optional[str]]]" = OrderedDict()
+        
         self.init_database()
     
+    def _configure_connection(self, conn: sqlite3.Connection) -> None:
+        """设置连接级PRAGMA（同步级别、缓存、忙等待等，每个连接都需设置）"""
+        conn.executescript("""
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-20000;
+            PRAGMA mmap_size=268435456;
+            PRAGMA busy_timeout=5000;
+            PRAGMA foreign_keys=ON;
+        """)
+    
+    @contextmanager
+    def _connect(self):
+        """获取共享连接（加锁串行访问，正常退出时提交，异常时回滚）"""
+        with self._lock, self._conn:
+            yield self._conn
+    
+    def _bump_versions(self, *session_ids: str) -> None:
+        """写入后递增版本号，使会话列表及相关会话的消息缓存失效"""
+        with self._lock:
+            self._sessions_version += 1
+            for session_id in session_ids:
+                self._session_versions[session_id] = self._session_versions.get(session_id, 0) + 1
+    
+    def _data_version(self) -> int:
+        """其他连接（包括其他进程）提交修改后，data_version 会变化"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
     def _get_encryption_key(self) -> bytes:
         """获取或生成加密密钥"""
         key_file = self.db_path.parent / "encryption.key"
@@ -46,11 +364,13 @@ class ChatHistoryDB:
             password = os.environ.get('DB_ENCRYPTION_PASSWORD', 'default_password_change_in_production').encode()
             salt = os.urandom(16)
             
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
+            # scrypt（n=2^15, r=8, p=1）：内存困难型KDF，比10万次PBKDF2更抗暴力破解；已有密钥文件不受影响
+            kdf = Scrypt(
                 salt=salt,
-                iterations=100000,
+                length=32,
+                n=2**15,
+                r=8,
+                p=1,
             )
             key = base64.urlsafe_b64encode(kdf.derive(password))
             
@@ -68,27 +388,40 @@ class ChatHistoryDB:
         """加密API密钥"""
         if not api_key:
             return ""
-        encrypted = self._cipher.encrypt(api_key.encode())
-        return base64.urlsafe_b64encode(encrypted).decode()
+        # Fernet令牌本身就是URL安全的base64文本，无需再次编码
+        return self._cipher.encrypt(api_key.encode()).decode()
     
     def _decrypt_api_key(self, encrypted_api_key: str) -> str:
         """解密API密钥"""
         if not encrypted_api_key:
             return ""
         try:
-            encrypted_data = base64.urlsafe_b64decode(encrypted_api_key.encode())
-            decrypted = self._cipher.decrypt(encrypted_data)
-            return decrypted.decode()
+            return self._cipher.decrypt(encrypted_api_key.encode()).decode()
         except Exception as e:
-            logger.error(f"解密API密钥失败: {e}")
+            logger.error("解密API密钥失败: %s", e)
             return ""
     
     def init_database(self):
         """初始化数据库表结构"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
+                # WAL模式持久保存在数据库文件中，只需初始化时设置一次（内存数据库不支持WAL）
+                if str(self.db_path) != ":memory:":
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                
+                # 旧版连接模式下DDL语句会各自自动提交：显式开启写事务，使建表、迁移和 user_version 更新
+                # 要么全部生效，要么在出错时整体回滚（其他进程同时初始化时在此等待，随后读到已更新的版本号）
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                # 结构已是最新版本时跳过建表、迁移检查和建索引
+                cursor.execute("PRAGMA user_version")
+                if cursor.fetchone()[0] >= _SCHEMA_VERSION:
+                    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages_fts'")
+                    self._fts_enabled = cursor.fetchone() is not None
+                    return
+                
                 # 创建用户表
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS users (
@@ -113,23 +446,13 @@ class ChatHistoryDB:
                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         document_info TEXT,  -- JSON格式存储文档信息
                         vector_store_type TEXT,
+                        message_count INTEGER NOT NULL DEFAULT 0,  -- 消息数量（冗余计数，避免聚合查询）
                         FOREIGN KEY (user_id) REFERENCES users (user_id)
                     )
                 """)
                 
                 # 创建消息表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS chat_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        session_id TEXT,
-                        role TEXT,  -- 'user' 或 'assistant'
-                        content TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        processing_time REAL,  -- 处理时间（秒）
-                        document_sources TEXT,  -- JSON格式存储相关文档来源
-                        FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
-                    )
-                """)
+                cursor.execute(_SQL_CREATE_MESSAGES.format(table="chat_messages"))
                 
                 # 检查是否需要迁移现有数据（添加user_id列）
                 cursor.execute("PRAGMA table_info(chat_sessions)")
@@ -147,25 +470,183 @@ class ChatHistoryDB:
                     cursor.execute("ALTER TABLE users ADD COLUMN dashscope_api_key TEXT")
                     logger.info("用户表迁移完成")
                 
+                # 检查会话表是否需要添加消息计数列，并回填已有数据
+                if 'message_count' not in columns:
+                    logger.info("为会话表添加消息计数列...")
+                    cursor.execute("ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+                    cursor.execute("""
+                        UPDATE chat_sessions
+                        SET message_count = (
+                            SELECT COUNT(*) FROM chat_messages m WHERE m.session_id = chat_sessions.session_id
+                        )
+                    """)
+                    logger.info("会话表迁移完成")
+                
+                # 检查消息表外键是否带级联删除（SQLite无法修改外键，旧表需重建）
+                cursor.execute("PRAGMA foreign_key_list(chat_messages)")
+                if not any(fk[2] == 'chat_sessions' and fk[6] == 'CASCADE' for fk in cursor.fetchall()):
+                    logger.info("重建消息表以启用级联删除...")
+                    self._rebuild_messages_table(cursor)
+                    logger.info("消息表迁移完成")
+                
+                # 旧版API密钥在Fernet令牌外又包了一层base64，去掉外层后直接存储令牌
+                self._migrate_api_key_encoding(cursor)
+                
+                # 新消息写入时由触发器更新会话的更新时间和消息计数
+                cursor.execute("""
+                    CREATE TRIGGER IF NOT EXISTS trg_touch_session AFTER INSERT ON chat_messages BEGIN
+                        UPDATE chat_sessions
+                        SET updated_at = CURRENT_TIMESTAMP, message_count = message_count + 1
+                        WHERE session_id = new.session_id;
+                    END
+                """)
+                
+                # 创建统计计数表
+                self._init_stats(cursor)
+                
+                # 创建全文索引（trigram分词支持中文子串匹配），由触发器与消息表保持同步
+                self._fts_enabled = self._init_fts(cursor)
+                
                 # 创建索引
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON chat_messages(session_id)")
+                # 复合索引同时满足按会话过滤和按时间排序，取代单列的 idx_messages_session
+                cursor.execute("""
+                    SELECT COUNT(*) FROM sqlite_master
+                    WHERE type = 'index' AND name IN ('idx_messages_session_ts', 'idx_sessions_user_updated')
+                """)
+                new_composite_index = cursor.fetchone()[0] < 2
+                cursor.execute("DROP INDEX IF EXISTS idx_messages_session")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_ts ON chat_messages(session_id, timestamp, id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON chat_messages(timestamp)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON chat_sessions(updated_at)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
                 
                 # 只有在user_id列存在时才创建相关索引
+                # 按用户过滤并按更新时间倒序的会话列表直接走索引范围扫描，无需临时排序
                 cursor.execute("PRAGMA table_info(chat_sessions)")
                 columns = [column[1] for column in cursor.fetchall()]
                 if 'user_id' in columns:
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON chat_sessions(user_id)")
+                    cursor.execute("DROP INDEX IF EXISTS idx_sessions_user")
+                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON chat_sessions(user_id, updated_at DESC)")
+                
+                # 新建索引后收集统计信息，让查询规划器选用复合索引
+                if new_composite_index:
+                    cursor.execute("ANALYZE")
                 
+                cursor.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
                 conn.commit()
                 logger.info("数据库初始化完成")
                 
         except Exception as e:
-            logger.error(f"数据库初始化失败: {e}")
+            logger.error("数据库初始化失败: %s", e)
             raise
     
+    def _init_fts(self, cursor: sqlite3.Cursor) -> bool:
+        """创建消息全文索引表及同步触发器，返回FTS5是否可用"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages_fts'")
+        fts_exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+                    content,
+                    content='chat_messages',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning("FTS5不可用，消息搜索将使用LIKE扫描: %s", e)
+            return False
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chat_messages_ai AFTER INSERT ON chat_messages BEGIN
+                INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chat_messages_ad AFTER DELETE ON chat_messages BEGIN
+                INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chat_messages_au AFTER UPDATE ON chat_messages BEGIN
+                INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        
+        if not fts_exists:
+            # 首次创建时为已有消息回填索引
+            logger.info("正在为已有消息建立全文索引...")
+            cursor.execute("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')")
+        
+        return True
+    
+    def _rebuild_messages_table(self, cursor: sqlite3.Cursor) -> None:
+        """按新表结构重建消息表（保留原有消息ID），索引和触发器随后由 init_database 重新创建"""
+        # 没有对应会话的孤立消息复制时会违反外键约束：先移入 chat_messages_orphans 备份表（不带约束），不直接丢弃
+        orphan_filter = "session_id NOT IN (SELECT session_id FROM chat_sessions)"
+        cursor.execute(f"SELECT COUNT(*) FROM chat_messages WHERE {orphan_filter}")
+        orphan_count = cursor.fetchone()[0]
+        if orphan_count:
+            cursor.execute("CREATE TABLE IF NOT EXISTS chat_messages_orphans AS SELECT * FROM chat_messages WHERE 0")
+            cursor.execute(f"INSERT INTO chat_messages_orphans SELECT * FROM chat_messages WHERE {orphan_filter}")
+            cursor.execute(f"DELETE FROM chat_messages WHERE {orphan_filter}")
+            logger.warning("重建消息表：%s 条消息没有对应的会话，已移至 chat_messages_orphans 表", orphan_count)
+        cursor.execute(_SQL_CREATE_MESSAGES.format(table="chat_messages_new"))
+        cursor.execute("""
+            INSERT INTO chat_messages_new (id, session_id, role, content, timestamp, processing_time, document_sources)
+            SELECT id, session_id, role, content, timestamp, processing_time, document_sources
+            FROM chat_messages
+        """)
+        cursor.execute("DROP TABLE chat_messages")
+        cursor.execute("ALTER TABLE chat_messages_new RENAME TO chat_messages")
+    
+    def _migrate_api_key_encoding(self, cursor: sqlite3.Cursor) -> None:
+        """将双重base64编码的API密钥改写为Fernet令牌本身（令牌以 gAAAAA 开头，外层编码后以 Z0FBQUFB 开头）"""
+        cursor.execute("SELECT user_id, dashscope_api_key FROM users WHERE dashscope_api_key LIKE 'Z0FBQUFB%'")
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        
+        cursor.executemany(
+            "UPDATE users SET dashscope_api_key = ? WHERE user_id = ?",
+            [(base64.urlsafe_b64decode(encrypted.encode()).decode(), user_id) for user_id, encrypted in rows]
+        )
+        logger.info("迁移API密钥存储格式: %s 个用户", len(rows))
+    
+    def _init_stats(self, cursor: sqlite3.Cursor) -> None:
+        """创建统计计数表及维护计数的触发器"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_stats'")
+        stats_exists = cursor.fetchone() is not None
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_stats (
+                k TEXT PRIMARY KEY,
+                v INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        if not stats_exists:
+            # 首次创建时按已有数据初始化计数
+            cursor.execute("""
+                INSERT INTO chat_stats (k, v) VALUES
+                    ('sessions', (SELECT COUNT(*) FROM chat_sessions)),
+                    ('messages', (SELECT COUNT(*) FROM chat_messages))
+            """)
+        
+        for table, key in (('chat_sessions', 'sessions'), ('chat_messages', 'messages')):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_stats_{key}_ai AFTER INSERT ON {table} BEGIN
+                    UPDATE chat_stats SET v = v + 1 WHERE k = '{key}';
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_stats_{key}_ad AFTER DELETE ON {table} BEGIN
+                    UPDATE chat_stats SET v = v - 1 WHERE k = '{key}';
+                END
+            """)
+    
     def upsert_user(self, user_id: int, username: str, name: str = None, email: str = None, avatar_url: str = None, dashscope_api_key: str = None) -> bool:
         """
         插入或更新用户信息
@@ -182,37 +663,40 @@ class ChatHistoryDB:
             success: 是否操作成功
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 if dashscope_api_key is not None:
                     # 更新包含API密钥
                     encrypted_key = self._encrypt_api_key(dashscope_api_key)
                     cursor.execute("""
-                        INSERT OR REPLACE INTO users (user_id, username, name, email, avatar_url, dashscope_api_key, last_login_at)
+                        INSERT INTO users (user_id, username, name, email, avatar_url, dashscope_api_key, last_login_at)
                         VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = excluded.username, name = excluded.name, email = excluded.email,
+                            avatar_url = excluded.avatar_url, dashscope_api_key = excluded.dashscope_api_key,
+                            last_login_at = CURRENT_TIMESTAMP
                     """, (user_id, username, name, email, avatar_url, encrypted_key))
-                    logger.info(f"更新用户信息和API密钥: {username} (ID: {user_id})")
+                    self._api_key_cache.pop(user_id, None)
+                    logger.info("更新用户信息和API密钥: %s (ID: %s)", username, user_id)
                 else:
                     # 只更新基本信息，保留现有API密钥
                     cursor.execute("""
-                        INSERT OR IGNORE INTO users (user_id, username, name, email, avatar_url, last_login_at)
+                        INSERT INTO users (user_id, username, name, email, avatar_url, last_login_at)
                         VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            name = excluded.name, email = excluded.email,
+                            avatar_url = excluded.avatar_url, last_login_at = CURRENT_TIMESTAMP
                     """, (user_id, username, name, email, avatar_url))
-                    
-                    # 更新现有用户的基本信息（不覆盖API密钥）
-                    cursor.execute("""
-                        UPDATE users 
-                        SET name = ?, email = ?, avatar_url = ?, last_login_at = CURRENT_TIMESTAMP
-                        WHERE user_id = ?
-                    """, (name, email, avatar_url, user_id))
-                    logger.info(f"更新用户基本信息: {username} (ID: {user_id})")
+                    logger.info("更新用户基本信息: %s (ID: %s)", username, user_id)
                 
                 conn.commit()
+                # 会话列表中包含用户名，需同时失效
+                self._bump_versions()
                 return True
                 
         except Exception as e:
-            logger.error(f"更新用户信息失败: {e}")
+            logger.error("更新用户信息失败: %s", e)
             return False
     
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
@@ -226,15 +710,14 @@ class ChatHistoryDB:
             user: 用户信息字典
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
                 row = cursor.fetchone()
                 
                 if row:
-                    user_info = dict(row)
+                    user_info = dict(zip([column[0] for column in cursor.description], row))
                     # 解密API密钥
                     if user_info.get('dashscope_api_key'):
                         user_info['dashscope_api_key'] = self._decrypt_api_key(user_info['dashscope_api_key'])
@@ -242,7 +725,7 @@ class ChatHistoryDB:
                 return None
                 
         except Exception as e:
-            logger.error(f"获取用户信息失败: {e}")
+            logger.error("获取用户信息失败: %s", e)
             return None
     
     def get_user_api_key(self, user_id: int) -> Optional[str]:
@@ -256,18 +739,29 @@ class ChatHistoryDB:
             api_key: 解密后的API密钥
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            # 命中缓存时跳过数据库查询和解密；其他连接提交修改后 data_version 变化，缓存随之失效。
+            # 本连接的写入不改变 data_version，检查、查询和写缓存须在同一把锁内完成，
+            # 否则并发的 update_user_api_key 移除缓存后可能被旧密钥覆盖
+            with self._connect() as conn:
+                data_version = self._data_version()
+                cached = self._api_key_cache.get(user_id)
+                if cached is not None and cached[0] == data_version:
+                    self._api_key_cache.move_to_end(user_id)
+                    return cached[1]
                 
+                cursor = conn.cursor()
                 cursor.execute("SELECT dashscope_api_key FROM users WHERE user_id = ?", (user_id,))
                 row = cursor.fetchone()
                 
-                if row and row[0]:
-                    return self._decrypt_api_key(row[0])
-                return None
+                api_key = self._decrypt_api_key(row[0]) if row and row[0] else None
+                
+                self._api_key_cache[user_id] = (data_version, api_key)
+                if len(self._api_key_cache) > _API_KEY_CACHE_SIZE:
+                    self._api_key_cache.popitem(last=False)
+                return api_key
                 
         except Exception as e:
-            logger.error(f"获取用户API密钥失败: {e}")
+            logger.error("获取用户API密钥失败: %s", e)
             return None
     
     def update_user_api_key(self, user_id: int, api_key: str) -> bool:
@@ -282,7 +776,7 @@ class ChatHistoryDB:
             success: 是否更新成功
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 encrypted_key = self._encrypt_api_key(api_key)
@@ -293,11 +787,12 @@ class ChatHistoryDB:
                 """, (encrypted_key, user_id))
                 
                 conn.commit()
-                logger.info(f"更新用户API密钥: 用户ID {user_id}")
+                self._api_key_cache.pop(user_id, None)
+                logger.info("更新用户API密钥: 用户ID %s", user_id)
                 return cursor.rowcount > 0
                 
         except Exception as e:
-            logger.error(f"更新用户API密钥失败: {e}")
+            logger.error("更新用户API密钥失败: %s", e)
             return False
 
     def create_session(self, session_name: str = None, document_info: Dict = None, vector_store_type: str = "chroma", user_id: int = None) -> str:
@@ -313,7 +808,8 @@ class ChatHistoryDB:
         Returns:
             session_id: 新创建的会话ID
         """
-        session_id = f"session_{int(time.time() * 1000)}"
+        # 随机ID：同一毫秒内连续创建也不会冲突
+        session_id = f"session_{secrets.token_hex(8)}"
         
         if not session_name:
             if document_info and 'file_name' in document_info:
@@ -322,20 +818,22 @@ class ChatHistoryDB:
                 session_name = f"对话 {datetime.now().strftime('%Y-%m-%d %H:%M')}"
         
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO chat_sessions (session_id, user_id, session_name, document_info, vector_store_type)
                     VALUES (?, ?, ?, ?, ?)
-                """, (session_id, user_id, session_name, json.dumps(document_info) if document_info else None, vector_store_type))
+                """, (session_id, user_id, session_name, _to_json(document_info), vector_store_type))
                 conn.commit()
                 
+                self._bump_versions()
+                
                 user_info = f" (用户ID: {user_id})" if user_id else ""
-                logger.info(f"创建新会话: {session_id} - {session_name}{user_info}")
+                logger.info("创建新会话: %s - %s%s", session_id, session_name, user_info)
                 return session_id
                 
         except Exception as e:
-            logger.error(f"创建会话失败: {e}")
+            logger.error("创建会话失败: %s", e)
             raise
     
     def add_message(self, session_id: str, role: str, content: str, processing_time: float = None, 
@@ -354,33 +852,105 @@ class ChatHistoryDB:
             message_id: 新添加的消息ID
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
-                # 添加消息
-                cursor.execute("""
-                    INSERT INTO chat_messages (session_id, role, content, processing_time, document_sources)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (session_id, role, content, processing_time, 
-                     json.dumps(document_sources) if document_sources else None))
+                # 单条 INSERT ... RETURNING；会话的更新时间和消息计数由触发器维护
+                cursor.execute(_SQL_INSERT_MSG_RETURNING, (session_id, role, content, processing_time,
+                                                           _to_json(document_sources)))
+                message_id = cursor.fetchone()[0]
                 
-                message_id = cursor.lastrowid
+                conn.commit()
+                self._bump_versions(session_id)
+                logger.info("添加消息到会话 %s: %s - %s 字符", session_id, role, len(content))
+                return message_id
                 
-                # 更新会话的最后更新时间
-                cursor.execute("""
-                    UPDATE chat_sessions 
-                    SET updated_at = CURRENT_TIMESTAMP 
-                    WHERE session_id = ?
-                """, (session_id,))
+        except Exception as e:
+            logger.error("添加消息失败: %s", e)
+            raise
+    
+    def add_messages(self, messages: List[Tuple[str, str, str, Optional[float], Optional[List[str]]]]) -> List[int]:
+        """
+        批量添加消息（单个事务，只提交一次）
+        
+        Args:
+            messages: 消息列表，每项为 (session_id, role, content, processing_time, document_sources)
+            
+        Returns:
+            message_ids: 新添加的消息ID列表（与输入顺序一致）
+        """
+        if not messages:
+            return []
+        
+        rows = [
+            (session_id, role, content, processing_time, _to_json(document_sources))
+            for session_id, role, content, processing_time, document_sources in messages
+        ]
+        
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # 立即获取写锁，保证本事务内自增ID连续
+                cursor.execute("BEGIN IMMEDIATE")
+                
+                # 批量添加消息
+                cursor.executemany(_SQL_INSERT_MSG, rows)
+                
+                cursor.execute("SELECT last_insert_rowid()")
+                last_id = cursor.fetchone()[0]
+                message_ids = list(range(last_id - len(rows) + 1, last_id + 1))
                 
                 conn.commit()
-                logger.info(f"添加消息到会话 {session_id}: {role} - {len(content)} 字符")
-                return message_id
+                self._bump_versions(*{row[0] for row in rows})
+                for session_id, role, content, _, _ in rows:
+                    logger.info("添加消息到会话 %s: %s - %s 字符", session_id, role, len(content))
+                return message_ids
                 
         except Exception as e:
-            logger.error(f"添加消息失败: {e}")
+            logger.error("添加消息失败: %s", e)
             raise
     
+    @contextmanager
+    def batch(self) -> Iterator[_MessageBatch]:
+        """
+        批量写入上下文：在一轮对话（或流式输出）中累积消息，退出时通过 add_messages 单事务提交
+        
+        用法:
+            with db.batch() as batch:
+                batch.add_message(session_id, "user", question)
+                batch.add_message(session_id, "assistant", answer, processing_time)
+            batch.message_ids  # 提交后的消息ID
+        
+        上下文内发生异常时丢弃已累积的消息。
+        """
+        pending = _MessageBatch()
+        yield pending
+        pending.message_ids = self.add_messages(pending.messages)
+    
+    def iter_session_messages(self, session_id: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐批迭代会话消息（fetchmany分批读取，不一次性加载全部结果）
+        
+        Args:
+            session_id: 会话ID
+            limit: 消息数量限制（None表示不限制）
+            
+        Yields:
+            message: 消息字典
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = 256
+            cursor.execute(_SQL_SEL_MSGS, (session_id, -1 if limit is None else limit))
+        
+        while True:
+            # 每批读取时才持锁，迭代过程中不阻塞其他调用
+            with self._lock:
+                batch = cursor.fetchmany()
+            if not batch:
+                break
+            yield from _row_dicts(cursor, batch)
+    
     def get_session_messages(self, session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
         """
         获取会话的所有消息
@@ -393,35 +963,18 @@ class ChatHistoryDB:
             messages: 消息列表
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row  # 使返回结果可以像字典一样访问
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT * FROM chat_messages 
-                    WHERE session_id = ? 
-                    ORDER BY timestamp 
-                    LIMIT ?
-                """, (session_id, limit))
-                
-                messages = []
-                for row in cursor.fetchall():
-                    message = {
-                        'id': row['id'],
-                        'role': row['role'],
-                        'content': row['content'],
-                        'timestamp': row['timestamp'],
-                        'processing_time': row['processing_time'],
-                        'document_sources': json.loads(row['document_sources']) if row['document_sources'] else None
-                    }
-                    messages.append(message)
-                
-                return messages
-                
+            with self._lock:
+                version = (self._session_versions.get(session_id, 0), self._data_version())
+            # 缓存中的行被所有调用方共用，返回浅拷贝，调用方修改结果不会影响缓存
+            return [dict(message) for message in self._messages_cache(session_id, limit, version)]
         except Exception as e:
-            logger.error(f"获取会话消息失败: {e}")
+            logger.error("获取会话消息失败: %s", e)
             return []
     
+    def _fetch_session_messages(self, session_id: str, limit: int, version: Tuple[int, int]) -> Tuple[Dict[str, Any], ...]:
+        """从数据库读取会话消息（由 _messages_cache 缓存，version 仅参与缓存键）"""
+        return tuple(self.iter_session_messages(session_id, limit))
+    
     def get_recent_sessions(self, limit: int = 20, user_id: int = None) -> List[Dict[str, Any]]:
         """
         获取最近的会话列表
@@ -434,56 +987,31 @@ class ChatHistoryDB:
             sessions: 会话列表
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                if user_id is not None:
-                    # 获取指定用户的会话
-                    cursor.execute("""
-                        SELECT s.*, u.username, u.name as user_name, COUNT(m.id) as message_count
-                        FROM chat_sessions s
-                        LEFT JOIN users u ON s.user_id = u.user_id
-                        LEFT JOIN chat_messages m ON s.session_id = m.session_id
-                        WHERE s.user_id = ?
-                        GROUP BY s.session_id
-                        ORDER BY s.updated_at DESC
-                        LIMIT ?
-                    """, (user_id, limit))
-                else:
-                    # 获取所有会话（包括匿名用户）
-                    cursor.execute("""
-                        SELECT s.*, u.username, u.name as user_name, COUNT(m.id) as message_count
-                        FROM chat_sessions s
-                        LEFT JOIN users u ON s.user_id = u.user_id
-                        LEFT JOIN chat_messages m ON s.session_id = m.session_id
-                        GROUP BY s.session_id
-                        ORDER BY s.updated_at DESC
-                        LIMIT ?
-                    """, (limit,))
-                
-                sessions = []
-                for row in cursor.fetchall():
-                    session = {
-                        'session_id': row['session_id'],
-                        'user_id': row['user_id'],
-                        'username': row['username'],
-                        'user_name': row['user_name'],
-                        'session_name': row['session_name'],
-                        'created_at': row['created_at'],
-                        'updated_at': row['updated_at'],
-                        'document_info': json.loads(row['document_info']) if row['document_info'] else None,
-                        'vector_store_type': row['vector_store_type'],
-                        'message_count': row['message_count']
-                    }
-                    sessions.append(session)
-                
-                return sessions
-                
+            with self._lock:
+                version = (self._sessions_version, self._data_version())
+            # 返回浅拷贝（同 get_session_messages）
+            return [dict(session) for session in self._sessions_cache(limit, user_id, version)]
         except Exception as e:
-            logger.error(f"获取会话列表失败: {e}")
+            logger.error("获取会话列表失败: %s", e)
             return []
     
+    def _fetch_recent_sessions(self, limit: int, user_id: Optional[int], version: Tuple[int, int]) -> Tuple[Dict[str, Any], ...]:
+        """从数据库读取最近会话（由 _sessions_cache 缓存，version 仅参与缓存键）"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            
+            if user_id is not None:
+                # 获取指定用户的会话
+                cursor.execute(_SQL_SEL_RECENT_BY_USER, (user_id, limit))
+            else:
+                # 获取所有会话（包括匿名用户）
+                cursor.execute(_SQL_SEL_RECENT, (limit,))
+            
+            sessions = _row_dicts(cursor, cursor.fetchall())
+            for session in sessions:
+                session['document_info'] = _LazyJSON(session['document_info'])
+            return tuple(sessions)
+    
     def delete_session(self, session_id: str) -> bool:
         """
         删除会话及其所有消息
@@ -495,21 +1023,19 @@ class ChatHistoryDB:
             success: 是否删除成功
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
-                # 删除消息
-                cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
-                
-                # 删除会话
-                cursor.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+                # 删除会话，消息通过外键级联删除
+                cursor.execute(_SQL_DEL_SESSION, (session_id,))
                 
                 conn.commit()
-                logger.info(f"删除会话: {session_id}")
+                self._bump_versions(session_id)
+                logger.info("删除会话: %s", session_id)
                 return True
                 
         except Exception as e:
-            logger.error(f"删除会话失败: {e}")
+            logger.error("删除会话失败: %s", e)
             return False
     
     def search_messages(self, query: str, session_id: str = None, user_id: int = None, limit: int = 50) -> List[Dict[str, Any]]:
@@ -523,65 +1049,72 @@ class ChatHistoryDB:
             limit: 结果数量限制
             
         Returns:
-            messages: 匹配的消息列表
+            messages: 匹配的消息列表（全文索引命中时 content_snippet 为SQLite生成的高亮摘要，否则为None）
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            use_fts, pattern, scope, scope_args = self._search_plan(query, session_id, user_id)
+            sql = _SQL_SEARCH_FTS[scope] if use_fts else _SQL_SEARCH_LIKE[scope]
+            
+            with self._connect() as conn:
                 cursor = conn.cursor()
+                cursor.execute(sql, (pattern, *scope_args, limit))
                 
-                if session_id:
-                    # 搜索指定会话
-                    cursor.execute("""
-                        SELECT m.*, s.session_name, s.user_id
-                        FROM chat_messages m
-                        JOIN chat_sessions s ON m.session_id = s.session_id
-                        WHERE m.session_id = ? AND m.content LIKE ?
-                        ORDER BY m.timestamp DESC
-                        LIMIT ?
-                    """, (session_id, f'%{query}%', limit))
-                elif user_id is not None:
-                    # 搜索指定用户的所有会话
-                    cursor.execute("""
-                        SELECT m.*, s.session_name, s.user_id
-                        FROM chat_messages m
-                        JOIN chat_sessions s ON m.session_id = s.session_id
-                        WHERE s.user_id = ? AND m.content LIKE ?
-                        ORDER BY m.timestamp DESC
-                        LIMIT ?
-                    """, (user_id, f'%{query}%', limit))
-                else:
-                    # 搜索所有消息
-                    cursor.execute("""
-                        SELECT m.*, s.session_name, s.user_id
-                        FROM chat_messages m
-                        JOIN chat_sessions s ON m.session_id = s.session_id
-                        WHERE m.content LIKE ?
-                        ORDER BY m.timestamp DESC
-                        LIMIT ?
-                    """, (f'%{query}%', limit))
-                
-                messages = []
-                for row in cursor.fetchall():
-                    message = {
-                        'id': row['id'],
-                        'session_id': row['session_id'],
-                        'session_name': row['session_name'],
-                        'user_id': row['user_id'],
-                        'role': row['role'],
-                        'content': row['content'],
-                        'timestamp': row['timestamp'],
-                        'processing_time': row['processing_time'],
-                        'document_sources': json.loads(row['document_sources']) if row['document_sources'] else None
-                    }
-                    messages.append(message)
-                
-                return messages
+                return _row_dicts(cursor, cursor.fetchall())
+                
+        except Exception as e:
+            logger.error("搜索消息失败: %s", e)
+            return []
+    
+    def search_messages_preview(self, query: str, session_id: str = None, user_id: int = None,
+                                preview_len: int = 100, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        搜索消息内容，只返回用于显示的预览
+        
+        Args:
+            query: 搜索关键词
+            session_id: 指定会话ID（可选）
+            user_id: 指定用户ID（可选）
+            preview_len: 短关键词（LIKE回退）时截取的正文长度
+            limit: 结果数量限制
+            
+        Returns:
+            messages: 匹配的消息列表，每条包含 role、timestamp、session_name、preview
+                     （全文索引命中时为高亮摘要，否则为截取的正文，超长时以 ... 结尾）
+        """
+        try:
+            use_fts, pattern, scope, scope_args = self._search_plan(query, session_id, user_id)
+            if use_fts:
+                sql, args = _SQL_SEARCH_PREVIEW_FTS[scope], (pattern, *scope_args, limit)
+            else:
+                sql, args = _SQL_SEARCH_PREVIEW_LIKE[scope], (preview_len, preview_len, pattern, *scope_args, limit)
+            
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, args)
+                
+                return _row_dicts(cursor, cursor.fetchall())
                 
         except Exception as e:
-            logger.error(f"搜索消息失败: {e}")
+            logger.error("搜索消息失败: %s", e)
             return []
     
+    def _search_plan(self, query: str, session_id: Optional[str], user_id: Optional[int]) -> Tuple[bool, str, str, tuple]:
+        """确定搜索方式和范围，返回 (是否使用全文索引, 匹配模式, 范围, 范围参数)"""
+        if session_id:
+            # 搜索指定会话
+            scope, scope_args = 'session', (session_id,)
+        elif user_id is not None:
+            # 搜索指定用户的所有会话
+            scope, scope_args = 'user', (user_id,)
+        else:
+            # 搜索所有消息
+            scope, scope_args = 'all', ()
+        
+        # trigram分词至少需要3个字符，更短的关键词回退到LIKE扫描
+        if self._fts_enabled and len(query) >= 3:
+            return True, '"' + query.replace('"', '""') + '"', scope, scope_args
+        return False, f'%{_like_escape(query)}%', scope, scope_args
+    
     def get_session_stats(self) -> Dict[str, Any]:
         """
         获取数据库统计信息
@@ -590,33 +1123,26 @@ class ChatHistoryDB:
             stats: 统计信息
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
-                # 总会话数
-                cursor.execute("SELECT COUNT(*) FROM chat_sessions")
-                total_sessions = cursor.fetchone()[0]
-                
-                # 总消息数
-                cursor.execute("SELECT COUNT(*) FROM chat_messages")
-                total_messages = cursor.fetchone()[0]
+                # 总会话数和总消息数（由触发器维护的计数器）
+                cursor.execute("SELECT k, v FROM chat_stats")
+                counters = dict(cursor.fetchall())
+                total_sessions = counters.get('sessions', 0)
+                total_messages = counters.get('messages', 0)
                 
-                # 最近7天的会话数
+                # 最近7天的会话数，以及有消息的会话数（只扫描会话表）
                 cursor.execute("""
-                    SELECT COUNT(*) FROM chat_sessions 
-                    WHERE created_at >= datetime('now', '-7 days')
+                    SELECT
+                        COUNT(*) FILTER (WHERE created_at >= datetime('now', '-7 days')),
+                        COUNT(*) FILTER (WHERE message_count > 0)
+                    FROM chat_sessions
                 """)
-                recent_sessions = cursor.fetchone()[0]
+                recent_sessions, active_sessions = cursor.fetchone()
                 
                 # 平均每个会话的消息数
-                cursor.execute("""
-                    SELECT AVG(message_count) FROM (
-                        SELECT COUNT(*) as message_count 
-                        FROM chat_messages 
-                        GROUP BY session_id
-                    )
-                """)
-                avg_messages_per_session = cursor.fetchone()[0] or 0
+                avg_messages_per_session = total_messages / active_sessions if active_sessions else 0
                 
                 return {
                     'total_sessions': total_sessions,
@@ -626,7 +1152,7 @@ class ChatHistoryDB:
                 }
                 
         except Exception as e:
-            logger.error(f"获取统计信息失败: {e}")
+            logger.error("获取统计信息失败: %s", e)
             return {}
     
     def export_session(self, session_id: str, format: str = 'json') -> Optional[str]:
@@ -642,9 +1168,15 @@ class ChatHistoryDB:
         """
         try:
             # 获取会话信息
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connect() as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                
+                if format == 'json':
+                    # 在SQLite内直接拼装完整JSON，不经过Python的字典构建和序列化
+                    cursor.execute(_SQL_EXPORT_JSON, (datetime.now().isoformat(), session_id))
+                    row = cursor.fetchone()
+                    return row[0] if row else None
                 
                 cursor.execute("SELECT * FROM chat_sessions WHERE session_id = ?", (session_id,))
                 session = cursor.fetchone()
@@ -652,37 +1184,91 @@ class ChatHistoryDB:
                 if not session:
                     return None
                 
-                messages = self.get_session_messages(session_id)
-                
-                if format == 'json':
-                    export_data = {
-                        'session_info': dict(session),
-                        'messages': messages,
-                        'exported_at': datetime.now().isoformat()
-                    }
-                    return json.dumps(export_data, ensure_ascii=False, indent=2)
-                
-                elif format == 'txt':
-                    lines = [
-                        f"会话名称: {session['session_name']}",
-                        f"创建时间: {session['created_at']}",
-                        f"文档信息: {session['document_info']}",
-                        f"向量存储: {session['vector_store_type']}",
-                        "-" * 50,
-                        ""
-                    ]
+                if format == 'txt':
+                    buf = io.StringIO()
+                    buf.write(f"会话名称: {session['session_name']}\n")
+                    buf.write(f"创建时间: {session['created_at']}\n")
+                    buf.write(f"文档信息: {session['document_info']}\n")
+                    buf.write(f"向量存储: {session['vector_store_type']}\n")
+                    buf.write("-" * 50 + "\n")
                     
-                    for msg in messages:
-                        timestamp = datetime.fromisoformat(msg['timestamp'].replace('Z', '+00:00'))
+                    # 逐条写入缓冲区，不再同时持有完整消息列表和行列表
+                    for msg in cursor.execute(_SQL_EXPORT_TXT_MSGS, (session_id,)):
                         role_name = "用户" if msg['role'] == 'user' else "助手"
-                        lines.append(f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}] {role_name}:")
-                        lines.append(msg['content'])
+                        buf.write(f"\n[{msg['ts_fmt']}] {role_name}:\n")
+                        buf.write(msg['content'])
                         if msg['processing_time']:
-                            lines.append(f"(处理时间: {msg['processing_time']:.2f}秒)")
-                        lines.append("")
+                            buf.write(f"\n(处理时间: {msg['processing_time']:.2f}秒)")
+                        buf.write("\n")
                     
-                    return "\n".join(lines)
+                    return buf.getvalue()
                 
         except Exception as e:
-            logger.error(f"导出会话失败: {e}")
-            return None
\ No newline at end of file
+            logger.error("导出会话失败: %s", e)
+            return None
+
+class AsyncChatHistoryDB:
+    """
+    ChatHistoryDB 的异步封装，供 FastAPI 等事件循环环境使用
+    
+    数据库调用在线程池中执行，慢查询（长LIKE搜索、大会话导出）不再阻塞事件循环。
+    """
+    
+    def __init__(self, db_path: str = "sqlite/chat_history.db"):
+        self.db = ChatHistoryDB(db_path)
+    
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+    
+    async def close(self):
+        await self._run(self.db.close)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    async def upsert_user(self, user_id: int, username: str, name: str = None, email: str = None, avatar_url: str = None, dashscope_api_key: str = None) -> bool:
+        return await self._run(self.db.upsert_user, user_id, username, name, email, avatar_url, dashscope_api_key)
+    
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self.db.get_user, user_id)
+    
+    async def get_user_api_key(self, user_id: int) -> Optional[str]:
+        return await self._run(self.db.get_user_api_key, user_id)
+    
+    async def update_user_api_key(self, user_id: int, api_key: str) -> bool:
+        return await self._run(self.db.update_user_api_key, user_id, api_key)
+    
+    async def create_session(self, session_name: str = None, document_info: Dict = None, vector_store_type: str = "chroma", user_id: int = None) -> str:
+        return await self._run(self.db.create_session, session_name, document_info, vector_store_type, user_id)
+    
+    async def add_message(self, session_id: str, role: str, content: str, processing_time: float = None, 
+                          document_sources: List[str] = None) -> int:
+        return await self._run(self.db.add_message, session_id, role, content, processing_time, document_sources)
+    
+    async def add_messages(self, messages: List[Tuple[str, str, str, Optional[float], Optional[List[str]]]]) -> List[int]:
+        return await self._run(self.db.add_messages, messages)
+    
+    async def get_session_messages(self, session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_session_messages, session_id, limit)
+    
+    async def get_recent_sessions(self, limit: int = 20, user_id: int = None) -> List[Dict[str, Any]]:
+        return await self._run(self.db.get_recent_sessions, limit, user_id)
+    
+    async def delete_session(self, session_id: str) -> bool:
+        return await self._run(self.db.delete_session, session_id)
+    
+    async def search_messages(self, query: str, session_id: str = None, user_id: int = None, limit: int = 50) -> List[Dict[str, Any]]:
+        return await self._run(self.db.search_messages, query, session_id, user_id, limit)
+    
+    async def search_messages_preview(self, query: str, session_id: str = None, user_id: int = None,
+                                      preview_len: int = 100, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self._run(self.db.search_messages_preview, query, session_id, user_id, preview_len, limit)
+    
+    async def get_session_stats(self) -> Dict[str, Any]:
+        return await self._run(self.db.get_session_stats)
+    
+    async def export_session(self, session_id: str, format: str = 'json') -> Optional[str]:
+        return await self._run(self.db.export_session, session_id, format)
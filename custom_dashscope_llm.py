@@ -1,13 +1,17 @@
 import os
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional
 from langchain_core.language_models.llms import LLM
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
 import dashscope
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Configure the API key once at import time so constructing the LLM is free
+dashscope.api_key = os.environ.get('DASHSCOPE_API_KEY')
+
 class CustomDashScopeLLM(LLM):
     """Custom DashScope LLM wrapper that works with LangChain"""
     
@@ -17,8 +21,9 @@ class CustomDashScopeLLM(LLM):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # Set the API key
-        dashscope.api_key = os.environ.get('DASHSCOPE_API_KEY')
+        # Pick up a key exported after import; otherwise keep the module-level one
+        if not dashscope.api_key:
+            dashscope.api_key = os.environ.get('DASHSCOPE_API_KEY')
         if not dashscope.api_key:
             raise ValueError("DASHSCOPE_API_KEY environment variable is not set")
     
@@ -33,23 +38,44 @@ class CustomDashScopeLLM(LLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> str:
-        """Call the DashScope API"""
+        """Call the DashScope API (assembled from the streamed chunks)"""
+        return "".join(
+            chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        )
+    
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream the DashScope API response incrementally"""
         try:
             from dashscope import Generation
             
-            response = Generation.call(
+            responses = Generation.call(
                 model=self.model_name,
                 prompt=prompt,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature,
                 stop=stop,
+                stream=True,
+                incremental_output=True,
                 **kwargs
             )
             
-            if response.status_code == 200:
-                return response.output.text
-            else:
-                raise Exception(f"DashScope API error: {response.message}")
+            for response in responses:
+                if response.status_code != 200:
+                    raise Exception(f"DashScope API error: {response.message}")
+                
+                text = response.output.text
+                if not text:
+                    continue
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    run_manager.on_llm_new_token(text, chunk=chunk)
+                yield chunk
                 
         except Exception as e:
             raise Exception(f"Error calling DashScope API: {str(e)}")
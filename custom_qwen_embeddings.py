@@ -1,36 +1,115 @@
 from typing import List
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from langchain_core.embeddings import Embeddings
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# text-embedding-v4 单次请求最多10条文本
+BATCH_SIZE = 10
+# 并发请求数
+MAX_WORKERS = 8
+
 class CustomQwenEmbeddings(Embeddings):
     """自定义千问嵌入类，使用OpenAI兼容接口"""
     
     def __init__(self, api_key: str, model: str = "text-embedding-v4"):
+        self.api_key = api_key
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
+            base_url=DASHSCOPE_BASE_URL,
+            max_retries=5  # 限流/网络错误时由SDK按指数退避自动重试
         )
+        self._async_client = None  # 首次异步调用时创建，复用连接池
         self.model = model
+        # 查询向量缓存：重复的查询不再请求接口
+        self._query_cache = lru_cache(maxsize=256)(self._embed_query)
+    
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """嵌入一批文本（不超过 BATCH_SIZE 条）"""
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=texts,
+            dimensions=1024,
+            encoding_format="float"
+        )
+        return [data.embedding for data in response.data]
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入多个文档"""
+        """嵌入多个文档（按批次拆分并发请求，结果保持输入顺序）"""
+        try:
+            batches = [texts[i:i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+            if len(batches) <= 1:
+                return self._embed_batch(texts) if texts else []
+            
+            with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(batches))) as executor:
+                results = executor.map(self._embed_batch, batches)
+                return [embedding for batch in results for embedding in batch]
+        except Exception as e:
+            logger.error(f"嵌入文档时出错: {e}")
+            raise
+    
+    def _embed_query(self, text: str) -> tuple:
+        """请求单个查询的嵌入向量（由 _query_cache 缓存）"""
+        response = self.client.embeddings.create(
+            model=self.model,
+            input=[text],
+            dimensions=1024,
+            encoding_format="float"
+        )
+        return tuple(response.data[0].embedding)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询"""
         try:
-            response = self.client.embeddings.create(
+            return list(self._query_cache(text))
+        except Exception as e:
+            logger.error(f"嵌入查询时出错: {e}")
+            raise
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """异步客户端（长连接，供LangChain异步链路使用）"""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=DASHSCOPE_BASE_URL,
+                max_retries=5
+            )
+        return self._async_client
+    
+    async def _aembed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        """异步嵌入一批文本"""
+        async with semaphore:
+            response = await self.async_client.embeddings.create(
                 model=self.model,
                 input=texts,
                 dimensions=1024,
                 encoding_format="float"
             )
-            return [data.embedding for data in response.data]
+        return [data.embedding for data in response.data]
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """异步嵌入多个文档（批次并发请求，最多 MAX_WORKERS 个同时进行）"""
+        try:
+            semaphore = asyncio.Semaphore(MAX_WORKERS)
+            batches = [texts[i:i + BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
+            results = await asyncio.gather(*(self._aembed_batch(batch, semaphore) for batch in batches))
+            return [embedding for batch in results for embedding in batch]
         except Exception as e:
-            print(f"嵌入文档时出错: {e}")
+            logger.error(f"嵌入文档时出错: {e}")
             raise
     
-    def embed_query(self, text: str) -> List[float]:
-        """嵌入单个查询"""
+    async def aembed_query(self, text: str) -> List[float]:
+        """异步嵌入单个查询"""
         try:
-            response = self.client.embeddings.create(
+            response = await self.async_client.embeddings.create(
                 model=self.model,
                 input=[text],
                 dimensions=1024,
@@ -38,5 +117,5 @@ class CustomQwenEmbeddings(Embeddings):
             )
             return response.data[0].embedding
         except Exception as e:
-            print(f"嵌入查询时出错: {e}")
+            logger.error(f"嵌入查询时出错: {e}")
             raise
\ No newline at end of file
@@ -1,20 +1,42 @@
 import os
+import base64
+from typing import List
+import numpy as np
 from dotenv import load_dotenv
 from openai import OpenAI
 
 # 加载.env文件中的环境变量
 load_dotenv()
 
+# text-embedding-v4 单次请求最多10条文本
+BATCH_SIZE = 10
+
+# 模块级客户端：导入后所有调用共用同一连接池
 client = OpenAI(
     api_key=os.getenv("DASHSCOPE_API_KEY"),  # 从环境变量获取API密钥
     base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"  # 百炼服务的base_url
 )
 
-completion = client.embeddings.create(
-    model="text-embedding-v4",
-    input='衣服的质量杠杠的，很漂亮，不枉我等了这么久啊，喜欢，以后还来这里买',
-    dimensions=1024, # 指定向量维度（仅 text-embedding-v3及 text-embedding-v4支持该参数）
-    encoding_format="float"
-)
+def embed(texts: List[str]) -> np.ndarray:
+    """
+    批量获取文本向量：每次请求携带 BATCH_SIZE 条文本，返回 (len(texts), 1024) 的float32矩阵，行顺序与输入一致
+    
+    接口以base64返回向量（little-endian float32），直接解码为NumPy数组，无需逐个解析JSON浮点数
+    """
+    vectors = []
+    for i in range(0, len(texts), BATCH_SIZE):
+        completion = client.embeddings.create(
+            model="text-embedding-v4",
+            input=texts[i:i + BATCH_SIZE],
+            dimensions=1024, # 指定向量维度（仅 text-embedding-v3及 text-embedding-v4支持该参数）
+            encoding_format="base64"
+        )
+        vectors.extend(np.frombuffer(base64.b64decode(data.embedding), dtype="<f4") for data in completion.data)
+    return np.stack(vectors) if vectors else np.empty((0, 1024), dtype=np.float32)
 
-print(completion.model_dump_json())
\ No newline at end of file
+if __name__ == "__main__":
+    vectors = embed([
+        '衣服的质量杠杠的，很漂亮，不枉我等了这么久啊，喜欢，以后还来这里买',
+        '物流很快，包装也很好，下次还会再来'
+    ])
+    print(f"共 {vectors.shape[0]} 个向量，维度 {vectors.shape[1]}")
@@ -4,9 +4,16 @@ GitHub OAuth 认证模块
 """
 
 import os
+import asyncio
+import base64
+import hashlib
+import html
 import secrets
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any
+from urllib.parse import urlencode
 import logging
 
 from fastapi import APIRouter, Request, HTTPException, Depends, Response
@@ -16,6 +23,12 @@ from jose import jwt, JWTError
 import httpx
 from dotenv import load_dotenv
 
+# 优先使用orjson解析GitHub接口返回的JSON，未安装时回退到标准库json
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 # 加载环境变量
 load_dotenv()
 
@@ -28,12 +41,61 @@ GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", secrets.token_urlsafe(32))
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRE_HOURS = 24 * 7  # 7天过期
+_EXPIRE_SECONDS = JWT_EXPIRE_HOURS * 3600
 
 # OAuth URLs
 GITHUB_AUTHORIZE_URL = "https://github.com/login/oauth/authorize"
 GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
 GITHUB_USER_URL = "https://api.github.com/user"
 
+# OAuth state 有效期（与 oauth_state cookie 的10分钟一致）及最大保存数量
+OAUTH_STATE_TTL = 600
+OAUTH_STATE_MAX = 50_000
+
+# JWT验证结果缓存的最大条目数
+JWT_CACHE_SIZE = 10_000
+# 本服务签发的令牌长度范围，超出范围的直接拒绝
+JWT_MIN_LENGTH = 100
+JWT_MAX_LENGTH = 4096
+
+# 按回调地址/Host缓存的条目上限（Host请求头由客户端提供，需限制数量）
+REDIRECT_CACHE_MAX = 64
+
+# 共享HTTP客户端的连接池限制
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+
+class _RandPool:
+    """
+    随机字节池：一次从 os.urandom 读取一大块，按需切分，减少系统调用次数
+    
+    取出的字节不会重复使用；fork 后子进程丢弃继承的缓冲区，避免父子进程生成相同的state。
+    """
+    
+    def __init__(self, size: int = 4096):
+        self._size = size
+        self._lock = threading.Lock()
+        self._refill()
+    
+    def _refill(self):
+        self._buf = os.urandom(self._size)
+        self._off = 0
+    
+    def take(self, n: int) -> bytes:
+        with self._lock:
+            if self._off + n > self._size:
+                self._refill()
+            chunk = self._buf[self._off:self._off + n]
+            self._off += n
+            return chunk
+    
+    def token_urlsafe(self, nbytes: int = 32) -> str:
+        """与 secrets.token_urlsafe 输出格式相同"""
+        return base64.urlsafe_b64encode(self.take(nbytes)).rstrip(b"=").decode("ascii")
+
+_rand_pool = _RandPool()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_rand_pool._refill)
+
 class GitHubAuth:
     """GitHub OAuth 认证管理器"""
     
@@ -42,6 +104,16 @@ class GitHubAuth:
         self.client_secret = GITHUB_CLIENT_SECRET
         # 默认使用独立的OAuth服务端口
         self.redirect_uri = redirect_uri or "http://localhost:8001/auth/callback"
+        # 授权URL中除state外的固定部分，按回调地址缓存
+        self._auth_prefixes: Dict[str, str] = {}
+        
+        # 共享的HTTP客户端：首次请求时创建，复用TCP/TLS连接
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        
+        # 已验证令牌的载荷缓存（LRU）：令牌摘要 -> payload，命中时只需检查是否过期
+        self._jwt_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._jwt_cache_lock = threading.Lock()
         
         if not self.client_id or not self.client_secret:
             logger.warning("GitHub OAuth 配置未完成，请设置 GITHUB_CLIENT_ID 和 GITHUB_CLIENT_SECRET 环境变量")
@@ -50,97 +122,149 @@ class GitHubAuth:
         """检查是否已配置 GitHub OAuth"""
         return bool(self.client_id and self.client_secret)
     
-    def get_authorization_url(self, state: str = None) -> str:
-        """获取 GitHub 授权 URL"""
+    async def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端（懒加载）"""
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.AsyncClient(limits=HTTP_LIMITS)
+        return self._client
+    
+    async def warmup(self):
+        """预先与 github.com 和 api.github.com 建立连接，首次登录无需等待TLS握手"""
+        client = await self._get_client()
+        results = await asyncio.gather(
+            client.head("https://github.com/", timeout=5),
+            client.head("https://api.github.com/", timeout=5),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"GitHub 连接预热失败: {result}")
+    
+    async def close(self):
+        """关闭共享的HTTP客户端"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def get_authorization_url(self, state: str = None, redirect_uri: str = None) -> str:
+        """获取 GitHub 授权 URL（redirect_uri 为空时使用默认回调地址）"""
         if not self.is_configured():
             raise ValueError("GitHub OAuth 未配置")
         
         if not state:
-            state = secrets.token_urlsafe(32)
+            state = _rand_pool.token_urlsafe(32)
         
-        params = {
-            "client_id": self.client_id,
-            "redirect_uri": self.redirect_uri,
-            "scope": "user:email",
-            "state": state
-        }
+        redirect_uri = redirect_uri or self.redirect_uri
+        
+        # 除state外的参数不随请求变化，每个回调地址只编码一次
+        auth_prefix = self._auth_prefixes.get(redirect_uri)
+        if auth_prefix is None:
+            auth_prefix = GITHUB_AUTHORIZE_URL + "?" + urlencode({
+                "client_id": self.client_id,
+                "redirect_uri": redirect_uri,
+                "scope": "user:email"
+            })
+            if len(self._auth_prefixes) >= REDIRECT_CACHE_MAX:
+                self._auth_prefixes.clear()
+            self._auth_prefixes[redirect_uri] = auth_prefix
         
-        param_string = "&".join([f"{k}={v}" for k, v in params.items()])
-        return f"{GITHUB_AUTHORIZE_URL}?{param_string}", state
+        return f"{auth_prefix}&{urlencode({'state': state})}", state
     
-    async def exchange_code_for_token(self, code: str) -> Optional[str]:
-        """使用授权码交换访问令牌"""
+    async def exchange_code_for_token(self, code: str, redirect_uri: str = None) -> Optional[str]:
+        """使用授权码交换访问令牌（redirect_uri 需与授权请求中的一致）"""
         if not self.is_configured():
             raise ValueError("GitHub OAuth 未配置")
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    GITHUB_TOKEN_URL,
-                    data={
-                        "client_id": self.client_id,
-                        "client_secret": self.client_secret,
-                        "code": code,
-                        "redirect_uri": self.redirect_uri
-                    },
-                    headers={"Accept": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    token_data = response.json()
-                    return token_data.get("access_token")
-                else:
-                    logger.error(f"获取访问令牌失败: {response.status_code} - {response.text}")
-                    return None
-                    
-            except Exception as e:
-                logger.error(f"交换访问令牌时发生错误: {e}")
+        try:
+            client = await self._get_client()
+            response = await client.post(
+                GITHUB_TOKEN_URL,
+                data={
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                    "code": code,
+                    "redirect_uri": redirect_uri or self.redirect_uri
+                },
+                headers={"Accept": "application/json"}
+            )
+            
+            if response.status_code == 200:
+                token_data = json_loads(response.content)
+                return token_data.get("access_token")
+            else:
+                logger.error(f"获取访问令牌失败: {response.status_code} - {response.text}")
                 return None
+                
+        except Exception as e:
+            logger.error(f"交换访问令牌时发生错误: {e}")
+            return None
     
     async def get_user_info(self, access_token: str) -> Optional[Dict[str, Any]]:
         """获取用户信息"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    GITHUB_USER_URL,
-                    headers={
-                        "Authorization": f"token {access_token}",
-                        "Accept": "application/json"
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"获取用户信息失败: {response.status_code} - {response.text}")
-                    return None
-                    
-            except Exception as e:
-                logger.error(f"获取用户信息时发生错误: {e}")
+        try:
+            client = await self._get_client()
+            response = await client.get(
+                GITHUB_USER_URL,
+                headers={
+                    "Authorization": f"token {access_token}",
+                    "Accept": "application/json"
+                }
+            )
+            
+            if response.status_code == 200:
+                return json_loads(response.content)
+            else:
+                logger.error(f"获取用户信息失败: {response.status_code} - {response.text}")
                 return None
+                
+        except Exception as e:
+            logger.error(f"获取用户信息时发生错误: {e}")
+            return None
     
     def create_jwt_token(self, user_data: Dict[str, Any]) -> str:
         """创建 JWT 令牌"""
+        now = int(time.time())
         payload = {
             "user_id": user_data["id"],
             "username": user_data["login"],
             "name": user_data.get("name", user_data["login"]),
             "email": user_data.get("email"),
             "avatar_url": user_data.get("avatar_url"),
-            "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRE_HOURS),
-            "iat": datetime.utcnow()
+            "exp": now + _EXPIRE_SECONDS,
+            "iat": now
         }
         
         return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     
     def verify_jwt_token(self, token: str) -> Optional[Dict[str, Any]]:
         """验证 JWT 令牌"""
+        # 结构明显不合法的令牌（扫描器、旧客户端）不进入缓存和签名校验
+        if not (JWT_MIN_LENGTH <= len(token) <= JWT_MAX_LENGTH) or token.count(".") != 2 or not token.startswith("eyJ"):
+            return None
+        
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        with self._jwt_cache_lock:
+            payload = self._jwt_cache.get(key)
+            if payload is not None:
+                if payload["exp"] > time.time():
+                    self._jwt_cache.move_to_end(key)
+                    return dict(payload)
+                # 已过期：移出缓存，交由 jwt.decode 给出过期错误
+                del self._jwt_cache[key]
+        
         try:
-            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-            return payload
+            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM], options={"require_exp": True})
         except JWTError as e:
             logger.error(f"JWT 令牌验证失败: {e}")
             return None
+        
+        with self._jwt_cache_lock:
+            self._jwt_cache[key] = payload
+            if len(self._jwt_cache) > JWT_CACHE_SIZE:
+                self._jwt_cache.popitem(last=False)
+        return dict(payload)
 
 # 全局认证实例
 github_auth = GitHubAuth()
@@ -148,49 +272,221 @@ github_auth = GitHubAuth()
 # 创建路由器
 auth_router = APIRouter(prefix="/auth", tags=["authentication"])
 
+class StateStore:
+    """
+    OAuth state 存储：条目自动过期，数量有上限
+    
+    所有条目有效期相同，插入顺序即过期顺序，每次写入时从最早的条目开始清理。
+    """
+    
+    def __init__(self, ttl: float = OAUTH_STATE_TTL, maxsize: int = OAUTH_STATE_MAX):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+    
+    def _purge(self, now: float):
+        while self._expires:
+            state, expires_at = next(iter(self._expires.items()))
+            if expires_at > now and len(self._expires) < self.maxsize:
+                break
+            del self._expires[state]
+    
+    def add(self, state: str):
+        now = time.monotonic()
+        self._purge(now)
+        self._expires[state] = now + self.ttl
+    
+    def __contains__(self, state: str) -> bool:
+        expires_at = self._expires.get(state)
+        return expires_at is not None and expires_at > time.monotonic()
+    
+    def pop(self, state: str, default=None):
+        return self._expires.pop(state, default)
+    
+    def __len__(self) -> int:
+        return len(self._expires)
+
 # 会话存储（简单内存存储，生产环境建议使用 Redis）
-session_store = {}
+session_store = StateStore()
+
+class JWTAuthMiddleware:
+    """
+    纯ASGI认证中间件：直接从原始请求头中读取 access_token cookie 并验证，
+    结果存入 scope["state"]["user"]，路由中无需再构造 Request 解析 cookie
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            token = _extract_access_token(scope["headers"])
+            user = github_auth.verify_jwt_token(token) if token else None
+            scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
+
+def _find_cookie(header: bytes, name: bytes) -> Optional[str]:
+    """在原始 Cookie 请求头中查找指定 cookie 的值"""
+    prefix = name + b"="
+    for part in header.split(b";"):
+        part = part.strip()
+        if part.startswith(prefix):
+            return part[len(prefix):].decode("latin-1")
+    return None
+
+def _extract_access_token(headers) -> Optional[str]:
+    """从原始请求头列表 [(name, value), ...] 中取出 access_token cookie，不解析其余cookie"""
+    # HTTP/2 客户端可能把cookie拆成多个请求头，需要逐个查找
+    for name, value in headers:
+        if name == b"cookie":
+            token = _find_cookie(value, b"access_token")
+            if token is not None:
+                return token
+    return None
 
 def get_current_user(request: Request) -> Optional[Dict[str, Any]]:
     """获取当前用户信息（从cookie中的JWT令牌）"""
-    token = request.cookies.get("access_token")
+    if isinstance(request, Request):
+        # 经过 JWTAuthMiddleware 的请求直接使用已验证的结果
+        state = request.scope.get("state", {})
+        if "user" in state:
+            return state["user"]
+        token = _extract_access_token(request.headers.raw)
+    else:
+        # gr.Request 等包装对象：属性访问会做JSON序列化，scope 中的bytes无法读取，只能走cookie
+        token = request.cookies.get("access_token")
     if not token:
         return None
     
     return github_auth.verify_jwt_token(token)
 
+# 静态页面：模块加载时编码为bytes，请求时直接返回
+_HTML_NOT_CONFIGURED = """
+<html>
+    <body>
+        <h1>GitHub OAuth 未配置</h1>
+        <p>请在 .env 文件中设置以下环境变量：</p>
+        <ul>
+            <li>GITHUB_CLIENT_ID</li>
+            <li>GITHUB_CLIENT_SECRET</li>
+        </ul>
+        <p><a href="/">返回首页</a></p>
+    </body>
+</html>
+""".encode()
+
+_HTML_MISSING_PARAMS = """
+<html>
+    <body>
+        <h1>授权失败</h1>
+        <p>缺少必要的授权参数</p>
+        <p><a href="/">返回首页</a></p>
+    </body>
+</html>
+""".encode()
+
+_HTML_STATE_INVALID = """
+<html>
+    <body>
+        <h1>授权失败</h1>
+        <p>状态验证失败，可能的CSRF攻击</p>
+        <p><a href="/">返回首页</a></p>
+    </body>
+</html>
+""".encode()
+
+_HTML_LOGOUT = """
+<html>
+    <head>
+        <meta http-equiv="refresh" content="2;url=/">
+    </head>
+    <body>
+        <h1>已成功登出</h1>
+        <p>正在跳转到首页...</p>
+        <p>如果没有自动跳转，<a href="/">点击这里</a></p>
+    </body>
+</html>
+""".encode()
+
+# 需要插入内容的页面：预先拆分为前缀/后缀，插入的内容经过HTML转义
+_HTML_ERROR_SUFFIX = """</p>
+        <p><a href="/">返回首页</a></p>
+    </body>
+</html>
+""".encode()
+
+_HTML_LOGIN_FAILED_PREFIX = """
+<html>
+    <body>
+        <h1>登录失败</h1>
+        <p>错误: """.encode()
+
+_HTML_AUTH_FAILED_PREFIX = """
+<html>
+    <body>
+        <h1>授权失败</h1>
+        <p>错误: """.encode()
+
+_HTML_LOGIN_SUCCESS_PREFIX = """
+<html>
+    <head>
+        <meta http-equiv="refresh" content="3;url=http://localhost:7860">
+        <style>
+            body { font-family: Arial, sans-serif; text-align: center; padding: 50px; }
+            .success { color: green; }
+            .info { color: #666; margin: 20px 0; }
+        </style>
+    </head>
+    <body>
+        <h1 class="success">🎉 GitHub 登录成功！</h1>
+        <p>欢迎 <strong>""".encode()
+
+_HTML_LOGIN_SUCCESS_SUFFIX = """</strong>！</p>
+        <p class="info">正在跳转到RAG应用...</p>
+        <p class="info">跳转后请点击"刷新登录状态"按钮来更新界面</p>
+        <p>如果没有自动跳转，<a href="http://localhost:7860">点击这里</a></p>
+        
+        <script>
+            // 3秒后自动跳转到主应用
+            setTimeout(function() {
+                window.location.href = 'http://localhost:7860';
+            }, 3000);
+        </script>
+    </body>
+</html>
+""".encode()
+
+def _render(prefix: bytes, text: Any, suffix: bytes) -> bytes:
+    """在预编码的前缀和后缀之间插入转义后的文本"""
+    return prefix + html.escape(str(text)).encode() + suffix
+
+# Host 请求头 -> 回调地址
+_host_cache: Dict[str, str] = {}
+
+def _redirect_uri_for(request: Request) -> str:
+    """根据请求的 Host 动态生成回调地址"""
+    host = request.headers.get("host", "localhost:7860")
+    redirect_uri = _host_cache.get(host)
+    if redirect_uri is None:
+        scheme = "https" if "localhost" not in host else "http"
+        redirect_uri = f"{scheme}://{host}/auth/callback"
+        if len(_host_cache) >= REDIRECT_CACHE_MAX:
+            _host_cache.clear()
+        _host_cache[host] = redirect_uri
+    return redirect_uri
+
 @auth_router.get("/github")
 async def github_login(request: Request):
     """GitHub 登录入口"""
     if not github_auth.is_configured():
-        return HTMLResponse(
-            content="""
-            <html>
-                <body>
-                    <h1>GitHub OAuth 未配置</h1>
-                    <p>请在 .env 文件中设置以下环境变量：</p>
-                    <ul>
-                        <li>GITHUB_CLIENT_ID</li>
-                        <li>GITHUB_CLIENT_SECRET</li>
-                    </ul>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=400
-        )
+        return HTMLResponse(content=_HTML_NOT_CONFIGURED, status_code=400)
     
     try:
-        # 设置回调URL（动态获取域名）
-        host = request.headers.get("host", "localhost:7860")
-        scheme = "https" if "localhost" not in host else "http"
-        github_auth.redirect_uri = f"{scheme}://{host}/auth/callback"
-        
-        # 生成授权URL
-        auth_url, state = github_auth.get_authorization_url()
+        # 生成授权URL（回调地址按请求的域名生成，不修改共享实例）
+        auth_url, state = github_auth.get_authorization_url(redirect_uri=_redirect_uri_for(request))
         
         # 存储state用于验证
-        session_store[state] = {"timestamp": datetime.utcnow()}
+        session_store.add(state)
         
         response = RedirectResponse(url=auth_url)
         response.set_cookie(key="oauth_state", value=state, max_age=600)  # 10分钟过期
@@ -198,69 +494,25 @@ async def github_login(request: Request):
         
     except Exception as e:
         logger.error(f"GitHub 登录失败: {e}")
-        return HTMLResponse(
-            content=f"""
-            <html>
-                <body>
-                    <h1>登录失败</h1>
-                    <p>错误: {str(e)}</p>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=500
-        )
+        return HTMLResponse(content=_render(_HTML_LOGIN_FAILED_PREFIX, e, _HTML_ERROR_SUFFIX), status_code=500)
 
 @auth_router.get("/callback")
 async def github_callback(request: Request, code: str = None, state: str = None, error: str = None):
     """GitHub OAuth 回调处理"""
     if error:
-        return HTMLResponse(
-            content=f"""
-            <html>
-                <body>
-                    <h1>授权失败</h1>
-                    <p>错误: {error}</p>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=400
-        )
+        return HTMLResponse(content=_render(_HTML_AUTH_FAILED_PREFIX, error, _HTML_ERROR_SUFFIX), status_code=400)
     
     if not code or not state:
-        return HTMLResponse(
-            content="""
-            <html>
-                <body>
-                    <h1>授权失败</h1>
-                    <p>缺少必要的授权参数</p>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=400
-        )
+        return HTMLResponse(content=_HTML_MISSING_PARAMS, status_code=400)
     
     # 验证state
     stored_state = request.cookies.get("oauth_state")
     if not stored_state or stored_state != state or state not in session_store:
-        return HTMLResponse(
-            content="""
-            <html>
-                <body>
-                    <h1>授权失败</h1>
-                    <p>状态验证失败，可能的CSRF攻击</p>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=400
-        )
+        return HTMLResponse(content=_HTML_STATE_INVALID, status_code=400)
     
     try:
         # 交换访问令牌
-        access_token = await github_auth.exchange_code_for_token(code)
+        access_token = await github_auth.exchange_code_for_token(code, _redirect_uri_for(request))
         if not access_token:
             raise Exception("无法获取访问令牌")
         
@@ -277,32 +529,7 @@ async def github_callback(request: Request, code: str = None, state: str = None,
         
         # 重定向到主应用并设置cookie
         response = HTMLResponse(
-            content=f"""
-            <html>
-                <head>
-                    <meta http-equiv="refresh" content="3;url=http://localhost:7860">
-                    <style>
-                        body {{ font-family: Arial, sans-serif; text-align: center; padding: 50px; }}
-                        .success {{ color: green; }}
-                        .info {{ color: #666; margin: 20px 0; }}
-                    </style>
-                </head>
-                <body>
-                    <h1 class="success">🎉 GitHub 登录成功！</h1>
-                    <p>欢迎 <strong>{user_info.get('name', user_info['login'])}</strong>！</p>
-                    <p class="info">正在跳转到RAG应用...</p>
-                    <p class="info">跳转后请点击"刷新登录状态"按钮来更新界面</p>
-                    <p>如果没有自动跳转，<a href="http://localhost:7860">点击这里</a></p>
-                    
-                    <script>
-                        // 3秒后自动跳转到主应用
-                        setTimeout(function() {{
-                            window.location.href = 'http://localhost:7860';
-                        }}, 3000);
-                    </script>
-                </body>
-            </html>
-            """
+            content=_render(_HTML_LOGIN_SUCCESS_PREFIX, user_info.get('name', user_info['login']), _HTML_LOGIN_SUCCESS_SUFFIX)
         )
         
         # 设置JWT cookie（7天过期）
@@ -324,37 +551,13 @@ async def github_callback(request: Request, code: str = None, state: str = None,
         
     except Exception as e:
         logger.error(f"OAuth 回调处理失败: {e}")
-        return HTMLResponse(
-            content=f"""
-            <html>
-                <body>
-                    <h1>登录失败</h1>
-                    <p>错误: {str(e)}</p>
-                    <p><a href="/">返回首页</a></p>
-                </body>
-            </html>
-            """,
-            status_code=500
-        )
+        return HTMLResponse(content=_render(_HTML_LOGIN_FAILED_PREFIX, e, _HTML_ERROR_SUFFIX), status_code=500)
 
 @auth_router.post("/logout")
 @auth_router.get("/logout")
 async def logout():
     """用户登出"""
-    response = HTMLResponse(
-        content="""
-        <html>
-            <head>
-                <meta http-equiv="refresh" content="2;url=/">
-            </head>
-            <body>
-                <h1>已成功登出</h1>
-                <p>正在跳转到首页...</p>
-                <p>如果没有自动跳转，<a href="/">点击这里</a></p>
-            </body>
-        </html>
-        """
-    )
+    response = HTMLResponse(content=_HTML_LOGOUT)
     response.delete_cookie("access_token")
     return response
 
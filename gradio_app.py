@@ -1,30 +1,184 @@
 import gradio as gr
 import tempfile
 import os
+import re
+import shutil
 import time
-from typing import List, Tuple, Optional, Dict, Any
+import threading
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Tuple, Optional, Dict, Any, Iterator, Deque
+import numpy as np
 from qianwen_paper_qa_api import QianwenPaperQAAPI, config
 from chat_history_db import ChatHistoryDB
 from github_auth import auth_router, get_current_user, github_auth
 import logging
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 配置日志：级别由 LOG_LEVEL 环境变量指定，默认只输出警告及以上
+# （导入的模块可能已调用过 basicConfig，因此显式设置根日志器的级别）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+logging.basicConfig(level=LOG_LEVEL)
+logging.getLogger().setLevel(LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# 问答结果缓存的最大条目数
+QA_CACHE_SIZE = 256
+# 问题向量的余弦相似度超过该值时视为同一问题，直接复用缓存的回答
+QA_SEMANTIC_THRESHOLD = 0.92
+
+# 服务端保留的聊天消息条数上限，超出后丢弃最早的消息
+CHAT_HISTORY_MAX = 200
+# 每次发送给聊天组件的最近消息条数
+CHAT_WINDOW = 50
+
+# 事件并发通道：所有用户共用同一个 GradioRAGApp 实例，按事件修改的共享状态分组
+# 初始化API、上传/删除文档（替换API对象、修改文档和向量库）逐个执行
+INGEST_LANE = "ingest"
+# 登录/登出、清空聊天、切换/删除会话（替换当前用户、当前会话和聊天历史）逐个执行
+SESSION_LANE = "session"
+# 问答和摘要：只追加聊天消息（由 _history_lock 保护），回答流式输出期间可与其他通道并发
+CHAT_LANE = "chat"
+CHAT_CONCURRENCY = 4
+
+# 流式回答的界面刷新间隔（秒）：期间收到的片段合并为一次更新
+STREAM_FLUSH_INTERVAL = 0.016
+
+# 自定义CSS样式
+_CSS_RAW = """
+.gradio-container {
+    max-width: 1400px !important;
+}
+.chat-container {
+    height: 500px !important;
+}
+.document-info {
+    background-color: var(--background-fill-secondary);
+    padding: 15px;
+    border-radius: 8px;
+    border-left: 4px solid var(--color-accent);
+    color: var(--body-text-color);
+}
+.dark .document-info {
+    background-color: rgba(255, 255, 255, 0.05);
+    border-left-color: #4a9eff;
+    color: #ffffff;
+}
+/* 确保Markdown内容在暗色模式下可见 */
+.dark .markdown {
+    color: #ffffff !important;
+}
+.dark .markdown strong {
+    color: #ffffff !important;
+}
+.dark .markdown h1, .dark .markdown h2, .dark .markdown h3 {
+    color: #ffffff !important;
+}
+.status-success {
+    color: #28a745;
+    font-weight: bold;
+}
+.status-error {
+    color: #dc3545;
+    font-weight: bold;
+}
+"""
+# 导入时去掉注释并压缩空白，页面只加载压缩后的样式
+_CSS = re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", _CSS_RAW, flags=re.S)).strip()
+
+# 页面标题
+_HEADER_MD = """
+# 🤖 千问RAG智能问答系统
+
+基于阿里云千问大模型的PDF文档问答系统，支持ChromaDB动态文档管理和FAISS传统模式。
+"""
+
+# 使用步骤和功能特色
+_USAGE_MD = """
+**📋 使用步骤：**
+1. 🔗 （可选）GitHub登录以启用个人数据管理
+2. 🔑 输入并保存DashScope API密钥，选择向量存储类型  
+3. 📄 上传PDF文档（支持批量上传）
+4. 💬 开始智能问答
+5. 📜 在右侧查看和管理个人对话历史
+
+**🎆 功能特色：**
+- ✅ **GitHub OAuth 登录**：多用户支持，完全的数据隔离保护
+- ✅ **加密密钥存储**：用户API密钥安全加密保存，自动恢复
+- ✅ **个人数据管理**：每个用户独立的会话历史和设置
+- ✅ **统一文档管理**：一个界面处理所有文档操作
+- ✅ **ChromaDB动态管理**：随时添加/删除文档
+- ✅ **多文档批量处理**：同时上传多个PDF
+- ✅ **实时文档列表**：查看所有已加载文档
+- ✅ **SQLite历史记录**：自动保存所有问答历史，支持搜索和回顾
+"""
+
+# 上传说明
+_UPLOAD_HELP_MD = """
+**📋 上传说明：**
+- **首次上传**：可以选择一个或多个PDF文件
+- **追加文档**：可以继续上传新文档（ChromaDB模式支持，FAISS模式会重置）
+- **文件限制**：仅支持PDF格式，建议单文件不超过100MB
+"""
+
+# 示例问题和使用说明
+_EXAMPLES_MD = """
+### 💡 示例问题
+**📖 单文档分析：**
+- 这篇文档的主要研究内容是什么？
+- 文档中提到了哪些关键技术或方法？
+- 有什么重要的结论或发现？
+
+**🗂️ 多文档对比（ChromaDB模式）：**
+- 这些文档有什么共同点或区别？
+- 请比较不同文档中的观点
+- 总结所有文档的核心内容
+
+### 📝 使用说明
+- **GitHub登录**：登录后享受个人数据管理和API密钥自动保存
+- **API密钥管理**：支持保存、自动填充、清除等完整的密钥管理功能
+- **ChromaDB模式**：支持多次上传、动态添加/删除文档，推荐使用
+- **FAISS模式**：高性能检索，但只支持单次批量上传
+- **上传方式**：可以一次选择多个PDF文件，也可以分多次上传
+- **文档限制**：仅支持PDF格式，建议单文件不超过100MB
+- **历史管理**：个人会话自动隔离，支持搜索和会话管理
+"""
+
+# 未选择会话时的详情提示
+_SELECT_SESSION_HINT = "请从上方列表中选择一个会话"
+
+def _doc_name(session: Dict[str, Any], default: str = "未知文档") -> str:
+    """会话关联文档的显示名称"""
+    return session.get('file_name') or default
+
 class GradioRAGApp:
     """Gradio RAG应用类"""
     
     def __init__(self):
         self.api = None
-        self.chat_history = []
+        self.chat_history: Deque[Dict[str, str]] = deque(maxlen=CHAT_HISTORY_MAX)
+        # 保护聊天历史的成对追加、遍历和按身份删除（并发的问答会同时修改它）
+        self._history_lock = threading.Lock()
         self.documents = {}  # 存储多个文档 {doc_id: document_info}
         self.current_doc_id = None
         self.vector_store_type = "chroma"  # 默认使用ChromaDB
         self.db = ChatHistoryDB()  # 初始化数据库
+        # 聊天消息在后台写入，不阻塞回答返回；单个线程保证写入按提交顺序执行
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-db")
         self.current_session_id = None  # 当前会话ID
-        self._session_option_map = {}  # 存储选项到session_id的映射
         self.current_user = None  # 当前登录用户
+        # 文档列表显示文本按版本号缓存：上传/删除文档或重新初始化API时版本号加一，旧版本的结果随之失效
+        self._docs_version = 0
+        self._docs_cache: Dict[int, str] = {}
+        self._summary_cache: Dict[int, Dict[str, Any]] = {}  # 文档摘要，同样按文档版本号缓存
+        self._docs_lock = threading.Lock()
+        # 问答结果缓存（LRU）：规范化后的问题 -> API返回结果，文档变化后清空
+        self._qa_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 语义缓存：已回答问题的归一化向量（每行一个）及对应的回答，按先进先出淘汰
+        self._qa_cache_vecs: Optional[np.ndarray] = None
+        self._qa_cache_answers: List[Dict[str, Any]] = []
+        # 问答缓存（精确匹配和语义两层）的读写由同一把锁保护，语义缓存的向量和回答必须成对读写
+        self._qa_cache_lock = threading.Lock()
     
     def set_current_user(self, user_data: Dict[str, Any]) -> None:
         """设置当前用户"""
@@ -43,6 +197,32 @@ class GradioRAGApp:
         """获取当前用户ID"""
         return self.current_user['user_id'] if self.current_user else None
     
+    def _load_sessions(self, limit: int, user_id: Optional[int]) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        """获取最近会话列表及按session_id的索引（数据库层按版本号缓存查询结果，写入后立即失效）"""
+        # 显示用字段在加载时计算一次，各显示函数只做格式化
+        sessions = [
+            {**session, 'updated_at_short': session['updated_at'][:16], 'doc_name': _doc_name(session)}
+            for session in self.db.get_recent_sessions(limit=limit, user_id=user_id)
+        ]
+        return sessions, {s['session_id']: s for s in sessions}
+    
+    def _get_recent_sessions_cached(self, limit: int = 20, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取最近会话列表"""
+        return self._load_sessions(limit, user_id)[0]
+    
+    def _save_messages_async(self, messages: List[Tuple[str, str, str, Optional[float], Optional[List[str]]]]) -> None:
+        """在后台线程中保存一组消息（同一事务）"""
+        future = self._db_executor.submit(self.db.add_messages, messages)
+        future.add_done_callback(self._on_messages_saved)
+    
+    def _on_messages_saved(self, future: Future) -> None:
+        if future.exception() is not None:
+            logger.error("保存聊天消息失败: %s", future.exception())
+    
+    def _wait_for_db_writes(self) -> None:
+        """等待已提交的后台写入全部完成（读取消息前调用，保证能读到刚保存的消息）"""
+        self._db_executor.submit(lambda: None).result()
+    
     def get_user_display_info(self) -> str:
         """获取用户显示信息"""
         if not self.current_user:
@@ -62,20 +242,27 @@ class GradioRAGApp:
             self.vector_store_type = vector_store_type
             
             self.api = QianwenPaperQAAPI(api_key=api_key.strip())
+            self._start_warmup()
+            self._bump_docs_version()
+            self._clear_qa_cache()
             
             # 如果用户已登录，保存API密钥到数据库
             if self.current_user:
                 user_id = self.current_user['user_id']
                 success = self.db.update_user_api_key(user_id, api_key.strip())
                 if success:
-                    logger.info(f"已保存用户 {self.current_user['username']} 的API密钥")
+                    logger.info("已保存用户 %s 的API密钥", self.current_user['username'])
                 else:
-                    logger.warning(f"保存用户 {self.current_user['username']} 的API密钥失败")
+                    logger.warning("保存用户 %s 的API密钥失败", self.current_user['username'])
             
             return f"✅ API初始化成功（使用{vector_store_type.upper()}），可以上传PDF文档了", True
         except Exception as e:
             return f"❌ API初始化失败: {str(e)}", False
     
+    def _start_warmup(self) -> None:
+        """在后台线程中预热嵌入接口，初始化按钮无需等待连接建立"""
+        threading.Thread(target=self.api.warmup, name="api-warmup", daemon=True).start()
+    
     def get_user_api_key(self) -> Optional[str]:
         """获取当前用户的API密钥"""
         if not self.current_user:
@@ -97,6 +284,9 @@ class GradioRAGApp:
             # 使用用户保存的API密钥初始化
             config.VECTOR_STORE_TYPE = self.vector_store_type
             self.api = QianwenPaperQAAPI(api_key=api_key)
+            self._start_warmup()
+            self._bump_docs_version()
+            self._clear_qa_cache()
             return f"✅ 已使用您保存的API密钥自动初始化（使用{self.vector_store_type.upper()}）", True
         except Exception as e:
             return f"❌ 使用保存的API密钥初始化失败: {str(e)}", False
@@ -116,57 +306,40 @@ class GradioRAGApp:
         is_first_upload = not self.documents  # 如果没有现有文档，则为首次上传
         
         try:
-            for i, file in enumerate(files):
-                try:
-                    # 获取原始文件名
+            if self.vector_store_type == "chroma":
+                # ChromaDB模式：首次上传时先用第一个文档初始化向量存储，其余文档一次性批量追加
+                results = []
+                pending = list(files)
+                if is_first_upload:
+                    results.append(self._process_one(pending.pop(0)))
+                if pending:
+                    results.extend(self._add_bulk(pending))
+                
+                # 按上传顺序登记结果
+                for original_filename, result in results:
+                    self._record_upload_result(original_filename, result, processed_docs, failed_docs)
+            else:
+                for i, file in enumerate(files):
                     original_filename = os.path.basename(file)
-                    
-                    # 处理单个文件
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                        with open(file, 'rb') as f:
-                            tmp_file.write(f.read())
-                        tmp_file_path = tmp_file.name
-                    
-                    # 智能选择处理方式
                     if i == 0 and is_first_upload:
                         # 第一个文档且是首次上传：初始化向量存储
-                        result = self.api.process_document(tmp_file_path, original_filename)
-                    elif self.vector_store_type == "chroma":
-                        # ChromaDB模式：添加到现有向量存储
-                        result = self.api.add_document(tmp_file_path, original_filename)
-                    elif self.vector_store_type == "faiss" and not is_first_upload:
+                        result = self._process_one(file, original_filename)[1]
+                    elif not is_first_upload:
                         # FAISS模式且不是首次上传：重置并重新初始化
                         failed_docs.append(f"{original_filename}: FAISS模式不支持追加文档，将重置文档库")
-                        result = self.api.process_document(tmp_file_path, original_filename)
+                        result = self._process_one(file, original_filename)[1]
                         # 清空现有文档记录，因为FAISS会重置
                         self.documents = {}
                     else:
                         # FAISS模式批量上传多个文档：跳过后续文档
                         failed_docs.append(f"{original_filename}: FAISS模式不支持批量上传多个文档，请使用ChromaDB模式")
                         continue
-                    
-                    # 清理临时文件
-                    try:
-                        os.unlink(tmp_file_path)
-                    except:
-                        pass
-                    
-                    if result['success']:
-                        doc_id = f"doc_{len(self.documents)}"
-                        self.documents[doc_id] = result['document_info']
-                        processed_docs.append(result['document_info']['file_name'])
-                        if not self.current_doc_id:  # 设置第一个为当前文档
-                            self.current_doc_id = doc_id
-                    else:
-                        failed_docs.append(f"{os.path.basename(file)}: {result['message']}")
-                        
-                except Exception as e:
-                    failed_docs.append(f"{os.path.basename(file)}: {str(e)}")
+                    self._record_upload_result(original_filename, result, processed_docs, failed_docs)
             
             # 生成结果信息
             if processed_docs:
                 if is_first_upload:
-                    self.chat_history = []  # 重置聊天历史
+                    self.chat_history.clear()  # 重置聊天历史
                     # 创建新的会话
                     doc_info = self.documents[list(self.documents.keys())[0]] if self.documents else None
                     self.current_session_id = self.db.create_session(
@@ -175,15 +348,19 @@ class GradioRAGApp:
                         user_id=self.get_current_user_id()
                     )
                     
+                processed_list = "\n".join(f"- {name}" for name in processed_docs)
                 info_text = f"""
 📄 **文档处理结果**
 ✅ 成功处理: {len(processed_docs)}个文档
-{chr(10).join([f"- {name}" for name in processed_docs])}
+{processed_list}
 """
                 if failed_docs:
-                    info_text += f"\n❌ 失败: {len(failed_docs)}个文档\n{chr(10).join([f"- {name}" for name in failed_docs])}"
+                    failed_list = "\n".join(f"- {name}" for name in failed_docs)
+                    info_text += f"\n❌ 失败: {len(failed_docs)}个文档\n{failed_list}"
                 
-                # 获取文档列表
+                # 获取文档列表（向量存储已变化，重新统计）
+                self._bump_docs_version()
+                self._clear_qa_cache()
                 doc_list = self.get_document_list()
                 
                 return f"✅ 成功处理 {len(processed_docs)} 个文档", info_text, True, doc_list
@@ -191,111 +368,303 @@ class GradioRAGApp:
                 return f"❌ 所有文档处理失败", "", False, ""
                 
         except Exception as e:
-            # 清理临时文件
-            try:
-                if 'tmp_file_path' in locals():
-                    os.unlink(tmp_file_path)
-            except:
-                pass
             return f"❌ 批量处理失败: {str(e)}", "", False, ""
     
+    def _as_pdf_path(self, file: str) -> Tuple[str, bool]:
+        """
+        获取可直接交给API处理的PDF路径，返回 (路径, 是否为需要清理的临时文件)
+        
+        Gradio 上传的文件已保存在磁盘上，扩展名为 .pdf 时直接使用；否则创建带 .pdf 扩展名的符号链接，
+        系统不支持符号链接时（如Windows）才复制文件内容
+        """
+        if file.lower().endswith('.pdf'):
+            return file, False
+        
+        # mkstemp 原子地占用一个唯一的文件名，再用符号链接替换占位文件
+        fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+        link_path = pdf_path + '.link'
+        try:
+            os.symlink(os.path.abspath(file), link_path)
+            os.replace(link_path, pdf_path)
+            os.close(fd)
+        except OSError:
+            self._remove_temp(link_path)
+            # 直接写入 mkstemp 打开的文件描述符，按1MB分块复制，不把整个文件读入内存
+            with os.fdopen(fd, 'wb') as tmp_file, open(file, 'rb') as f:
+                shutil.copyfileobj(f, tmp_file, length=1024 * 1024)
+        return pdf_path, True
+    
+    def _remove_temp(self, tmp_file_path: str) -> None:
+        """清理临时文件"""
+        try:
+            os.unlink(tmp_file_path)
+        except OSError:
+            pass
+    
+    def _process_one(self, file: str, original_filename: Optional[str] = None) -> Tuple[str, Any]:
+        """
+        用单个上传文件初始化向量存储（调用方已取得文件名时可直接传入）
+        
+        返回 (原始文件名, 处理结果或异常)
+        """
+        original_filename = original_filename or os.path.basename(file)
+        try:
+            pdf_path, is_temp = self._as_pdf_path(file)
+            try:
+                result = self.api.process_document(pdf_path, original_filename)
+            finally:
+                if is_temp:
+                    self._remove_temp(pdf_path)
+            return original_filename, result
+        except Exception as e:
+            return original_filename, e
+    
+    def _add_bulk(self, files: List[str]) -> List[Tuple[str, Any]]:
+        """
+        将多个上传文件一次性追加到现有向量存储（ChromaDB）
+        
+        返回与输入顺序一致的 (原始文件名, 处理结果或异常) 列表
+        """
+        names = [os.path.basename(file) for file in files]
+        pdf_paths = []
+        tmp_file_paths = []
+        try:
+            for file in files:
+                pdf_path, is_temp = self._as_pdf_path(file)
+                pdf_paths.append(pdf_path)
+                if is_temp:
+                    tmp_file_paths.append(pdf_path)
+            results = self.api.add_documents_bulk(list(zip(pdf_paths, names)))
+            return list(zip(names, results))
+        except Exception as e:
+            return [(name, e) for name in names]
+        finally:
+            for tmp_file_path in tmp_file_paths:
+                self._remove_temp(tmp_file_path)
+    
+    def _record_upload_result(self, original_filename: str, result: Any, processed_docs: List[str], failed_docs: List[str]) -> None:
+        """登记单个文件的处理结果"""
+        if isinstance(result, Exception):
+            failed_docs.append(f"{original_filename}: {str(result)}")
+        elif result['success']:
+            doc_id = f"doc_{len(self.documents)}"
+            self.documents[doc_id] = result['document_info']
+            processed_docs.append(result['document_info']['file_name'])
+            if not self.current_doc_id:  # 设置第一个为当前文档
+                self.current_doc_id = doc_id
+        else:
+            failed_docs.append(f"{original_filename}: {result['message']}")
+    
     def get_document_summary(self) -> Tuple[List, str]:
         """获取文档摘要"""
         if not self.api:
-            return self.chat_history, "❌ 请先初始化API"
+            return self._chat_window(), "❌ 请先初始化API"
         
         if not self.documents:
-            return self.chat_history, "❌ 请先上传PDF文档"
+            return self._chat_window(), "❌ 请先上传PDF文档"
         
         try:
             start_time = time.time()
-            result = self.api.get_document_summary()
+            result = self._summary_cached()
             processing_time = time.time() - start_time
             
             if result['success']:
                 # 保存到数据库
                 if self.current_session_id:
-                    self.db.add_message(
-                        session_id=self.current_session_id,
-                        role="user",
-                        content="请总结这篇文档的主要内容"
-                    )
-                    self.db.add_message(
-                        session_id=self.current_session_id,
-                        role="assistant",
-                        content=result['answer'],
-                        processing_time=processing_time
-                    )
+                    self._save_messages_async([
+                        (self.current_session_id, "user", "请总结这篇文档的主要内容", None, None),
+                        (self.current_session_id, "assistant", result['answer'], processing_time, None)
+                    ])
                 
                 # 添加到聊天历史
-                self.chat_history.append({
-                    "role": "user",
-                    "content": "请总结这篇文档的主要内容"
-                })
-                self.chat_history.append({
-                    "role": "assistant",
-                    "content": result['answer']
-                })
-                return self.chat_history, ""
+                with self._history_lock:
+                    self.chat_history.append({
+                        "role": "user",
+                        "content": "请总结这篇文档的主要内容"
+                    })
+                    self.chat_history.append({
+                        "role": "assistant",
+                        "content": result['answer']
+                    })
+                return self._chat_window(), ""
             else:
-                return self.chat_history, f"❌ {result['message']}"
+                return self._chat_window(), f"❌ {result['message']}"
                 
         except Exception as e:
-            return self.chat_history, f"❌ 获取摘要失败: {str(e)}"
+            return self._chat_window(), f"❌ 获取摘要失败: {str(e)}"
     
-    def ask_question(self, question: str, history: List) -> Tuple[List, str]:
-        """询问问题"""
+    def _summary_cached(self) -> Dict[str, Any]:
+        """获取文档摘要，文档未变化（版本号相同）时直接返回上次成功生成的摘要"""
+        with self._docs_lock:
+            version = self._docs_version
+            cached = self._summary_cache.get(version)
+        if cached is not None:
+            return cached
+        
+        result = self.api.get_document_summary()
+        if result['success']:
+            with self._docs_lock:
+                if version == self._docs_version:
+                    self._summary_cache[version] = result
+        return result
+    
+    def ask_question(self, question: str, history: List) -> Iterator[Tuple[List, str]]:
+        """
+        询问问题（流式输出）
+        
+        回答片段先累积在本地缓冲区，每隔 STREAM_FLUSH_INTERVAL 秒才写入最后一条助手消息并刷新一次界面，
+        命中问答缓存时一次性返回完整回答
+        """
         if not self.api:
-            return history, "❌ 请先初始化API"
+            yield history, "❌ 请先初始化API"
+            return
         
         if not self.documents:
-            return history, "❌ 请先上传PDF文档"
+            yield history, "❌ 请先上传PDF文档"
+            return
         
         if not question or not question.strip():
-            return history, "❌ 请输入问题"
+            yield history, "❌ 请输入问题"
+            return
         
+        question = question.strip()
+        # 回答保存到提问时所在的会话，流式输出期间切换会话或重新初始化API不影响本次回答
+        session_id = self.current_session_id
+        api = self.api
+        user_msg = {"role": "user", "content": question}
+        assistant_msg = {"role": "assistant", "content": ""}
         try:
             start_time = time.time()
-            result = self.api.ask_question(question.strip())
-            processing_time = time.time() - start_time
+            key, q_vec, result = self._lookup_qa_cache(question)
             
-            if result['success']:
-                # 保存到数据库
-                if self.current_session_id:
-                    # 保存用户问题
-                    self.db.add_message(
-                        session_id=self.current_session_id,
-                        role="user",
-                        content=question.strip()
-                    )
-                    # 保存助手回答
-                    self.db.add_message(
-                        session_id=self.current_session_id,
-                        role="assistant",
-                        content=result['answer'],
-                        processing_time=processing_time
-                    )
-                
-                # 更新聊天历史
-                self.chat_history.append({
-                    "role": "user",
-                    "content": question.strip()
-                })
-                self.chat_history.append({
-                    "role": "assistant",
-                    "content": result['answer']
-                })
-                return self.chat_history, ""
+            # 更新聊天历史：先追加用户问题和一条空的助手消息，之后只通过 assistant_msg 修改这条消息
+            with self._history_lock:
+                self.chat_history.append(user_msg)
+                self.chat_history.append(assistant_msg)
+            
+            if result is not None:
+                answer = result['answer']
+                assistant_msg["content"] = answer
             else:
-                return history, f"❌ {result['message']}"
-                
+                parts = []
+                buf = []
+                last_flush = time.monotonic()
+                for delta in api.ask_question_stream(question):
+                    buf.append(delta)
+                    now = time.monotonic()
+                    if now - last_flush >= STREAM_FLUSH_INTERVAL:
+                        parts.extend(buf)
+                        buf.clear()
+                        assistant_msg["content"] = "".join(parts)
+                        last_flush = now
+                        yield self._chat_window(), ""
+                parts.extend(buf)
+                answer = "".join(parts)
+                assistant_msg["content"] = answer
+                self._store_qa_cache(key, q_vec, {'success': True, 'answer': answer, 'question': question})
+            processing_time = time.time() - start_time
+            
+            # 保存到数据库
+            if session_id:
+                # 用户问题和助手回答在同一事务中保存（后台写入）
+                self._save_messages_async([
+                    (session_id, "user", question, None, None),
+                    (session_id, "assistant", answer, processing_time, None)
+                ])
+            
+            yield self._chat_window(), ""
+            
+        except Exception as e:
+            # 只移除本次追加的两条消息，聊天历史中的其他消息不受影响
+            self._discard_messages(user_msg, assistant_msg)
+            yield history, f"❌ 询问失败: {str(e)}"
+    
+    def _discard_messages(self, *messages: Dict[str, str]) -> None:
+        """按对象身份从聊天历史中移除指定消息（内容相同的其他消息保留）"""
+        with self._history_lock:
+            for message in messages:
+                for i, m in enumerate(self.chat_history):
+                    if m is message:
+                        del self.chat_history[i]
+                        break
+    
+    def _begin_streaming(self):
+        """流式回答开始前关闭Markdown渲染，避免每次刷新都重新解析全部消息"""
+        return gr.update(render_markdown=False)
+    
+    def _finalize_markdown(self):
+        """流式回答结束后恢复Markdown渲染（聊天内容不变）"""
+        return gr.update(render_markdown=True)
+    
+    def _lookup_qa_cache(self, question: str) -> Tuple[str, Optional[np.ndarray], Optional[Dict[str, Any]]]:
+        """
+        查找问答缓存，返回 (缓存键, 问题向量, 缓存的回答或None)
+        
+        相同的问题（忽略大小写和多余空白）直接返回缓存的回答；否则比较问题向量，
+        与已回答问题足够相似时也复用其回答。问题向量由检索时使用的同一嵌入对象生成，
+        其查询缓存使随后的检索不会再次请求嵌入接口。
+        """
+        key = " ".join(question.split()).lower()
+        with self._qa_cache_lock:
+            result = self._qa_cache.get(key)
+            if result is not None:
+                self._qa_cache.move_to_end(key)
+                return key, None, result
+        
+        q_vec = self._embed_question(question)
+        if q_vec is not None:
+            with self._qa_cache_lock:
+                vecs, answers = self._qa_cache_vecs, self._qa_cache_answers
+            if vecs is not None:
+                sims = vecs @ q_vec
+                best = int(np.argmax(sims))
+                if sims[best] > QA_SEMANTIC_THRESHOLD:
+                    return key, q_vec, answers[best]
+        return key, q_vec, None
+    
+    def _store_qa_cache(self, key: str, q_vec: Optional[np.ndarray], result: Dict[str, Any]) -> None:
+        """缓存成功的回答（失败结果不缓存）"""
+        with self._qa_cache_lock:
+            self._qa_cache[key] = result
+            if len(self._qa_cache) > QA_CACHE_SIZE:
+                self._qa_cache.popitem(last=False)
+            if q_vec is not None:
+                if self._qa_cache_vecs is None:
+                    self._qa_cache_vecs = q_vec[np.newaxis, :]
+                else:
+                    self._qa_cache_vecs = np.vstack([self._qa_cache_vecs, q_vec])[-QA_CACHE_SIZE:]
+                self._qa_cache_answers = (self._qa_cache_answers + [result])[-QA_CACHE_SIZE:]
+    
+    def _embed_question(self, question: str) -> Optional[np.ndarray]:
+        """获取问题的L2归一化向量，无可用嵌入对象或请求失败时返回None（跳过语义缓存）"""
+        embeddings = getattr(self.api, 'embeddings', None)
+        if embeddings is None:
+            return None
+        try:
+            vec = np.asarray(embeddings.embed_query(question), dtype=np.float32)
         except Exception as e:
-            return history, f"❌ 询问失败: {str(e)}"
+            logger.warning("生成问题向量失败，跳过语义缓存: %s", e)
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+    
+    def _clear_qa_cache(self) -> None:
+        """文档变化后清空问答缓存（包括语义缓存）"""
+        with self._qa_cache_lock:
+            self._qa_cache.clear()
+            self._qa_cache_vecs = None
+            self._qa_cache_answers = []
     
     def get_document_list(self) -> str:
-        """获取文档列表"""
+        """获取文档列表（结果缓存到下次上传/删除文档或重新初始化API）"""
         if not self.api:
             return "未初始化API"
+        
+        with self._docs_lock:
+            version = self._docs_version
+            cached = self._docs_cache.get(version)
+        if cached is not None:
+            return cached
             
         try:
             result = self.api.list_documents()
@@ -305,13 +674,25 @@ class GradioRAGApp:
                     source_file = doc.get('source_file', 'Unknown')
                     chunks_count = doc.get('chunks_count', 0)
                     doc_list += f"{i}. **{source_file}** ({chunks_count} 个文本块)\n"
-                return doc_list
             else:
-                return "📁 **当前文档列表:** 无文档"
+                doc_list = "📁 **当前文档列表:** 无文档"
+            if result['success']:
+                with self._docs_lock:
+                    # 查询期间文档已变化时不缓存过期的结果
+                    if version == self._docs_version:
+                        self._docs_cache = {version: doc_list}
+            return doc_list
         except Exception as e:
             return f"获取文档列表失败: {str(e)}"
     
     
+    def _bump_docs_version(self) -> None:
+        """文档变化后调用，使缓存的文档列表失效"""
+        with self._docs_lock:
+            self._docs_version += 1
+            self._docs_cache.clear()
+            self._summary_cache.clear()
+    
     def delete_document(self, filename: str) -> Tuple[str, str]:
         """删除文档（仅ChromaDB支持）"""
         if not self.api:
@@ -328,6 +709,8 @@ class GradioRAGApp:
             
             if result['success']:
                 # 更新文档列表
+                self._bump_docs_version()
+                self._clear_qa_cache()
                 doc_list = self.get_document_list()
                 return f"✅ 成功删除文档: {filename} ({result['deleted_count']} 个文本块)", doc_list
             else:
@@ -336,9 +719,15 @@ class GradioRAGApp:
         except Exception as e:
             return f"❌ 删除文档失败: {str(e)}", ""
     
+    def _chat_window(self) -> List[Dict[str, str]]:
+        """聊天组件显示的最近 CHAT_WINDOW 条消息（完整的历史记录保存在数据库中）"""
+        with self._history_lock:
+            start = max(0, len(self.chat_history) - CHAT_WINDOW)
+            return list(itertools.islice(self.chat_history, start, None))
+    
     def clear_chat(self) -> Tuple[List, str]:
         """清空聊天记录"""
-        self.chat_history = []
+        self.chat_history.clear()
         return [], ""
     
     def get_session_history(self, session_id: str) -> Tuple[List, str]:
@@ -347,20 +736,16 @@ class GradioRAGApp:
             return [], "❌ 请选择一个会话"
         
         try:
+            self._wait_for_db_writes()
             messages = self.db.get_session_messages(session_id)
             
             # 转换为Gradio格式
-            history = []
-            for msg in messages:
-                history.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+            history = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
             
-            self.chat_history = history
+            self.chat_history = deque(history, maxlen=CHAT_HISTORY_MAX)
             self.current_session_id = session_id
             
-            return history, f"✅ 已加载会话历史（{len(messages)}条消息）"
+            return self._chat_window(), f"✅ 已加载会话历史（{len(messages)}条消息）"
             
         except Exception as e:
             return [], f"❌ 加载会话历史失败: {str(e)}"
@@ -368,110 +753,74 @@ class GradioRAGApp:
     def get_sessions_display_text(self) -> str:
         """获取会话列表的显示文本"""
         try:
-            sessions = self.db.get_recent_sessions(limit=20)
+            sessions = self._get_recent_sessions_cached(limit=20)
             if not sessions:
                 return "📜 **历史会话：** 暂无历史记录"
             
-            session_list = "📜 **最近会话：**\n\n"
-            for i, session in enumerate(sessions):
-                msg_count = session['message_count']
-                updated_time = session['updated_at'][:16]  # 截取到分钟
-                doc_name = "未知文档"
-                if session['document_info']:
-                    doc_info = session['document_info']
-                    if isinstance(doc_info, str):
-                        import json
-                        try:
-                            doc_info = json.loads(doc_info)
-                        except:
-                            pass
-                    if isinstance(doc_info, dict) and 'file_name' in doc_info:
-                        doc_name = doc_info['file_name']
-                
-                # 使用HTML样式来使其可点击
-                session_list += f"""<div style="border: 1px solid #ddd; border-radius: 8px; padding: 12px; margin: 8px 0; background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%); cursor: pointer;" onclick="selectSession('{session['session_id']}', {i})">
+            # 使用HTML样式来使其可点击
+            session_items = [f"""<div style="border: 1px solid #ddd; border-radius: 8px; padding: 12px; margin: 8px 0; background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%); cursor: pointer;" onclick="selectSession('{session['session_id']}', {i})">
 🔸 **{session['session_name']}**  
-📄 文档: {doc_name}  
-💬 消息: {msg_count}条 | ⏰ {updated_time}
+📄 文档: {session['doc_name']}  
+💬 消息: {session['message_count']}条 | ⏰ {session['updated_at_short']}
 </div>
 
-"""
+""" for i, session in enumerate(sessions)]
             
-            return session_list
+            return "📜 **最近会话：**\n\n" + "".join(session_items)
             
         except Exception as e:
-            logger.error(f"获取会话列表失败: {e}")
+            logger.error("获取会话列表失败: %s", e)
             return f"❌ 获取会话列表失败: {str(e)}"
     
-    def get_sessions_for_radio(self) -> List[str]:
-        """获取会话选项列表（用于Radio组件）"""
+    def get_sessions_for_radio(self) -> List[Tuple[str, str]]:
+        """获取会话选项列表（用于Radio组件），每项为 (显示文本, session_id)，选中时Radio的值即为session_id"""
         try:
             # 只获取当前用户的会话
             user_id = self.get_current_user_id()
-            sessions = self.db.get_recent_sessions(limit=20, user_id=user_id)
-            if not sessions:
-                return []
-            
-            session_options = []
-            for session in sessions:
-                msg_count = session['message_count']
-                updated_time = session['updated_at'][:16]
-                doc_name = "未知文档"
-                if session['document_info']:
-                    doc_info = session['document_info']
-                    if isinstance(doc_info, str):
-                        import json
-                        try:
-                            doc_info = json.loads(doc_info)
-                        except:
-                            pass
-                    if isinstance(doc_info, dict) and 'file_name' in doc_info:
-                        doc_name = doc_info['file_name']
-                
-                # 创建选项显示文本，同时在内部保存session_id的映射
-                option_text = f"🔸 {session['session_name']} | 📄 {doc_name} | 💬 {msg_count}条 | ⏰ {updated_time}"
-                session_options.append(option_text)
-                
-                # 保存选项到session_id的映射
-                if not hasattr(self, '_session_option_map'):
-                    self._session_option_map = {}
-                self._session_option_map[option_text] = session['session_id']
-            
-            return session_options
+            sessions = self._get_recent_sessions_cached(limit=20, user_id=user_id)
+            return [
+                (f"🔸 {session['session_name']} | 📄 {session['doc_name']} | 💬 {session['message_count']}条 | ⏰ {session['updated_at_short']}", session['session_id'])
+                for session in sessions
+            ]
             
         except Exception as e:
-            logger.error(f"获取会话选项失败: {e}")
+            logger.error("获取会话选项失败: %s", e)
             return []
     
+    def get_sessions_stats_text(self) -> Optional[str]:
+        """当前用户历史会话的统计信息，没有会话时返回None"""
+        sessions = self._get_recent_sessions_cached(limit=20, user_id=self.get_current_user_id())
+        if not sessions:
+            return None
+        
+        user_info = "您的" if self.current_user else "全部"
+        return f"""
+### 📊 {user_info}历史记录统计
+
+📋 **会话数：** {len(sessions)}个  
+🕒 **最新会话：** {sessions[0]['session_name']}  
+📄 **最新文档：** {sessions[0]['doc_name']}  
+
+---
+💡 **操作提示：** 点击上方列表中的会话选项将自动加载对话
+        """
+    
     def get_session_details(self, session_id: str) -> str:
         """获取会话详情显示"""
         if not session_id:
-            return "请从上方列表中选择一个会话"
+            return _SELECT_SESSION_HINT
         
         try:
-            sessions = self.db.get_recent_sessions(limit=100)
-            session = next((s for s in sessions if s['session_id'] == session_id), None)
+            session = self._load_sessions(100, None)[1].get(session_id)
             
             if not session:
                 return "❌ 会话不存在"
             
-            doc_name = "未知文档"
-            if session['document_info']:
-                doc_info = session['document_info']
-                if isinstance(doc_info, str):
-                    import json
-                    try:
-                        doc_info = json.loads(doc_info)
-                    except:
-                        pass
-                if isinstance(doc_info, dict) and 'file_name' in doc_info:
-                    doc_name = doc_info['file_name']
-            
             details = f"""
 ### 📋 会话详情
 
 **🔸 会话名称：** {session['session_name']}  
-**📄 关联文档：** {doc_name}  
+**📄 关联文档：** {session['doc_name']}  
 **💬 消息数量：** {session['message_count']}条  
 **🗂️ 存储模式：** {session['vector_store_type'].upper()}  
 **⏰ 创建时间：** {session['created_at'][:19]}  
@@ -495,11 +844,12 @@ class GradioRAGApp:
             return "❌ 请输入会话ID"
         
         try:
+            self._wait_for_db_writes()
             success = self.db.delete_session(session_id.strip())
             if success:
                 if self.current_session_id == session_id.strip():
                     self.current_session_id = None
-                    self.chat_history = []
+                    self.chat_history.clear()
                 return f"✅ 已删除会话: {session_id.strip()}"
             else:
                 return f"❌ 删除失败，会话不存在: {session_id.strip()}"
@@ -515,21 +865,20 @@ class GradioRAGApp:
         try:
             # 只搜索当前用户的消息
             user_id = self.get_current_user_id()
-            messages = self.db.search_messages(query.strip(), user_id=user_id, limit=20)
+            self._wait_for_db_writes()
+            messages = self.db.search_messages_preview(query.strip(), user_id=user_id, preview_len=100, limit=20)
             if not messages:
                 return f"🔍 **搜索结果：** 未找到包含 '{query.strip()}' 的消息"
             
-            result = f"🔍 **搜索结果：** 找到 {len(messages)} 条相关消息\n\n"
+            parts = [f"🔍 **搜索结果：** 找到 {len(messages)} 条相关消息\n\n"]
             
             for msg in messages:
                 timestamp = msg['timestamp'][:16]
                 role_name = "👤 用户" if msg['role'] == 'user' else "🤖 助手"
-                content_preview = msg['content'][:100] + "..." if len(msg['content']) > 100 else msg['content']
-                
-                result += f"📍 **{msg['session_name']}** ({timestamp})\n"
-                result += f"{role_name}: {content_preview}\n\n"
+                # 预览由数据库生成：全文索引命中时为高亮摘要，短关键词时为截取的正文
+                parts.append(f"📍 **{msg['session_name']}** ({timestamp})\n{role_name}: {msg['preview']}\n\n")
             
-            return result
+            return "".join(parts)
             
         except Exception as e:
             return f"❌ 搜索失败: {str(e)}"
@@ -537,47 +886,7 @@ class GradioRAGApp:
     def create_interface(self):
         """创建Gradio界面"""
         
-        # 自定义CSS样式
-        css = """
-        .gradio-container {
-            max-width: 1400px !important;
-        }
-        .chat-container {
-            height: 500px !important;
-        }
-        .document-info {
-            background-color: var(--background-fill-secondary);
-            padding: 15px;
-            border-radius: 8px;
-            border-left: 4px solid var(--color-accent);
-            color: var(--body-text-color);
-        }
-        .dark .document-info {
-            background-color: rgba(255, 255, 255, 0.05);
-            border-left-color: #4a9eff;
-            color: #ffffff;
-        }
-        /* 确保Markdown内容在暗色模式下可见 */
-        .dark .markdown {
-            color: #ffffff !important;
-        }
-        .dark .markdown strong {
-            color: #ffffff !important;
-        }
-        .dark .markdown h1, .dark .markdown h2, .dark .markdown h3 {
-            color: #ffffff !important;
-        }
-        .status-success {
-            color: #28a745;
-            font-weight: bold;
-        }
-        .status-error {
-            color: #dc3545;
-            font-weight: bold;
-        }
-        """
-        
-        with gr.Blocks(css=css, title="千问RAG问答系统", theme=gr.themes.Soft()) as app:
+        with gr.Blocks(css=_CSS, title="千问RAG问答系统", theme=gr.themes.Soft()) as app:
             # 添加用户认证状态组件
             user_info_display = gr.Markdown(
                 value=self.get_user_display_info(),
@@ -587,11 +896,7 @@ class GradioRAGApp:
             # 用户认证控制区域
             with gr.Row():
                 with gr.Column(scale=3):
-                    gr.Markdown("""
-                    # 🤖 千问RAG智能问答系统
-                    
-                    基于阿里云千问大模型的PDF文档问答系统，支持ChromaDB动态文档管理和FAISS传统模式。
-                    """)
+                    gr.Markdown(_HEADER_MD)
                 
                 with gr.Column(scale=1):
                     # GitHub OAuth 状态显示
@@ -610,24 +915,7 @@ class GradioRAGApp:
                         github_login_btn = gr.Button("GitHub 登录", size="sm", visible=False)
                         logout_btn = gr.Button("登出", size="sm", visible=False)
             
-            gr.Markdown("""
-            **📋 使用步骤：**
-            1. 🔗 （可选）GitHub登录以启用个人数据管理
-            2. 🔑 输入并保存DashScope API密钥，选择向量存储类型  
-            3. 📄 上传PDF文档（支持批量上传）
-            4. 💬 开始智能问答
-            5. 📜 在右侧查看和管理个人对话历史
-            
-            **🎆 功能特色：**
-            - ✅ **GitHub OAuth 登录**：多用户支持，完全的数据隔离保护
-            - ✅ **加密密钥存储**：用户API密钥安全加密保存，自动恢复
-            - ✅ **个人数据管理**：每个用户独立的会话历史和设置
-            - ✅ **统一文档管理**：一个界面处理所有文档操作
-            - ✅ **ChromaDB动态管理**：随时添加/删除文档
-            - ✅ **多文档批量处理**：同时上传多个PDF
-            - ✅ **实时文档列表**：查看所有已加载文档
-            - ✅ **SQLite历史记录**：自动保存所有问答历史，支持搜索和回顾
-            """)
+            gr.Markdown(_USAGE_MD)
             
             with gr.Row():
                 with gr.Column(scale=1):
@@ -675,12 +963,7 @@ class GradioRAGApp:
                             file_count="multiple"
                         )
                         
-                        gr.Markdown("""
-                        **📋 上传说明：**
-                        - **首次上传**：可以选择一个或多个PDF文件
-                        - **追加文档**：可以继续上传新文档（ChromaDB模式支持，FAISS模式会重置）
-                        - **文件限制**：仅支持PDF格式，建议单文件不超过100MB
-                        """)
+                        gr.Markdown(_UPLOAD_HELP_MD)
                         
                         # 文档删除（ChromaDB）
                         with gr.Row(visible=False) as delete_row:
@@ -723,7 +1006,9 @@ class GradioRAGApp:
                         label="问答历史",
                         height=400,
                         elem_classes=["chat-container"],
-                        type="messages"
+                        type="messages",
+                        layout="bubble",
+                        latex_delimiters=[]  # 不解析LaTeX公式
                     )
                     
                     with gr.Row():
@@ -781,23 +1066,9 @@ class GradioRAGApp:
                     )
                     
                     # 初始会话详情显示
-                    initial_details_text = "请从上方列表中选择一个会话"
+                    initial_details_text = _SELECT_SESSION_HINT
                     if initial_sessions_options:
-                        # 从数据库获取当前用户的统计信息
-                        user_id = self.get_current_user_id()
-                        sessions_data = self.db.get_recent_sessions(limit=20, user_id=user_id)
-                        if sessions_data:
-                            user_info = "您的" if self.current_user else "全部"
-                            initial_details_text = f"""
-### 📊 {user_info}历史记录统计
-
-📋 **会话数：** {len(sessions_data)}个  
-🕒 **最新会话：** {sessions_data[0]['session_name']}  
-📄 **最新文档：** {sessions_data[0].get('document_info', {}).get('file_name', '未知文档') if sessions_data[0].get('document_info') else '未知文档'}  
-
----
-💡 **操作提示：** 点击上方列表中的会话选项将自动加载对话
-                            """
+                        initial_details_text = self.get_sessions_stats_text() or initial_details_text
                     
                     # 会话详情显示
                     session_details = gr.Markdown(
@@ -830,27 +1101,7 @@ class GradioRAGApp:
                     )
             
             # 示例问题和使用说明
-            gr.Markdown("""
-            ### 💡 示例问题
-            **📖 单文档分析：**
-            - 这篇文档的主要研究内容是什么？
-            - 文档中提到了哪些关键技术或方法？
-            - 有什么重要的结论或发现？
-            
-            **🗂️ 多文档对比（ChromaDB模式）：**
-            - 这些文档有什么共同点或区别？
-            - 请比较不同文档中的观点
-            - 总结所有文档的核心内容
-            
-            ### 📝 使用说明
-            - **GitHub登录**：登录后享受个人数据管理和API密钥自动保存
-            - **API密钥管理**：支持保存、自动填充、清除等完整的密钥管理功能
-            - **ChromaDB模式**：支持多次上传、动态添加/删除文档，推荐使用
-            - **FAISS模式**：高性能检索，但只支持单次批量上传
-            - **上传方式**：可以一次选择多个PDF文件，也可以分多次上传
-            - **文档限制**：仅支持PDF格式，建议单文件不超过100MB
-            - **历史管理**：个人会话自动隔离，支持搜索和会话管理
-            """)
+            gr.Markdown(_EXAMPLES_MD)
             
             # 事件绑定
             
@@ -917,7 +1168,7 @@ class GradioRAGApp:
                                 ""  # current_api_display
                             )
                     except Exception as e:
-                        logger.error(f"刷新登录状态失败: {e}")
+                        logger.error("刷新登录状态失败: %s", e)
                         return (
                             "👤 匿名用户",
                             gr.update(visible=True),
@@ -941,7 +1192,7 @@ class GradioRAGApp:
             def handle_logout():
                 """处理登出"""
                 self.current_user = None
-                self.chat_history = []
+                self.chat_history.clear()
                 self.current_session_id = None
                 # 刷新会话列表
                 options = self.get_sessions_for_radio()
@@ -958,13 +1209,17 @@ class GradioRAGApp:
                 github_login_btn.click(
                     fn=handle_refresh_login_status,
                     inputs=[],
-                    outputs=[user_info_display, github_login_btn, logout_btn, sessions_radio, auth_status, user_settings_group, current_api_display]
+                    outputs=[user_info_display, github_login_btn, logout_btn, sessions_radio, auth_status, user_settings_group, current_api_display],
+                    concurrency_limit=1,
+                    concurrency_id=SESSION_LANE
                 )
                 
                 logout_btn.click(
                     fn=handle_logout,
                     inputs=[],
-                    outputs=[user_info_display, github_login_btn, logout_btn, chatbot, sessions_radio, history_status]
+                    outputs=[user_info_display, github_login_btn, logout_btn, chatbot, sessions_radio, history_status],
+                    concurrency_limit=1,
+                    concurrency_id=SESSION_LANE
                 )
             
             # API初始化
@@ -1035,7 +1290,9 @@ class GradioRAGApp:
                 fn=update_file_visibility,
                 inputs=[api_key_input, vector_store_choice],
                 outputs=[api_status, document_management_group, delete_row],
-                show_progress=True
+                show_progress=True,
+                concurrency_limit=1,
+                concurrency_id=INGEST_LANE
             )
             
             # 自动填充API密钥按钮
@@ -1064,27 +1321,13 @@ class GradioRAGApp:
             
             # 文档上传（智能处理）
             def update_upload_status(files):
+                prev_session_id = self.current_session_id
                 status, info, visible, doc_list = self.upload_documents(files)
-                # 如果上传成功，自动刷新历史记录
-                if visible:
+                # 如果上传成功且创建了新会话，自动刷新历史记录；追加到现有会话时历史记录不变
+                if visible and self.current_session_id != prev_session_id:
                     options = self.get_sessions_for_radio()
                     # 更新会话统计（按用户过滤）
-                    user_id = self.get_current_user_id()
-                    sessions_data = self.db.get_recent_sessions(limit=20, user_id=user_id)
-                    if sessions_data:
-                        user_info = "您的" if self.current_user else "全部"
-                        updated_details = f"""
-### 📊 {user_info}历史记录统计
-
-📋 **会话数：** {len(sessions_data)}个  
-🕒 **最新会话：** {sessions_data[0]['session_name']}  
-📄 **最新文档：** {sessions_data[0].get('document_info', {}).get('file_name', '未知文档') if sessions_data[0].get('document_info') else '未知文档'}  
-
----
-💡 **操作提示：** 点击上方列表中的会话选项将自动加载对话
-                        """
-                    else:
-                        updated_details = "请从上方列表中选择一个会话"
+                    updated_details = self.get_sessions_stats_text() or _SELECT_SESSION_HINT
                     
                     return (status, info, gr.update(visible=visible), gr.update(value=doc_list, visible=visible), 
                            gr.update(choices=options), updated_details, gr.update(visible=False))
@@ -1095,7 +1338,9 @@ class GradioRAGApp:
                 fn=update_upload_status,
                 inputs=[file_upload],
                 outputs=[upload_status, document_info, summary_btn, document_list, sessions_radio, session_details, session_action_row],
-                show_progress=True
+                show_progress=True,
+                concurrency_limit=1,
+                concurrency_id=INGEST_LANE
             )
             
             # 删除文档
@@ -1107,7 +1352,9 @@ class GradioRAGApp:
                 fn=handle_delete_document,
                 inputs=[delete_filename],
                 outputs=[upload_status, document_list, delete_filename],
-                show_progress=True
+                show_progress=True,
+                concurrency_limit=1,
+                concurrency_id=INGEST_LANE
             )
             
             # 获取文档摘要
@@ -1115,15 +1362,30 @@ class GradioRAGApp:
                 fn=self.get_document_summary,
                 inputs=[],
                 outputs=[chatbot, question_status],
-                show_progress=True
+                show_progress=True,
+                concurrency_limit=CHAT_CONCURRENCY,
+                concurrency_id=CHAT_LANE
             )
             
             # 询问问题
             ask_btn.click(
+                fn=self._begin_streaming,
+                inputs=[],
+                outputs=[chatbot],
+                queue=False
+            ).then(
                 fn=self.ask_question,
                 inputs=[question_input, chatbot],
                 outputs=[chatbot, question_status],
-                show_progress=True
+                show_progress=True,
+                queue=True,
+                concurrency_limit=CHAT_CONCURRENCY,
+                concurrency_id=CHAT_LANE
+            ).then(
+                fn=self._finalize_markdown,
+                inputs=[],
+                outputs=[chatbot],
+                queue=False
             ).then(
                 lambda: "",  # 清空输入框
                 inputs=[],
@@ -1132,10 +1394,23 @@ class GradioRAGApp:
             
             # 回车键发送问题
             question_input.submit(
+                fn=self._begin_streaming,
+                inputs=[],
+                outputs=[chatbot],
+                queue=False
+            ).then(
                 fn=self.ask_question,
                 inputs=[question_input, chatbot],
                 outputs=[chatbot, question_status],
-                show_progress=True
+                show_progress=True,
+                queue=True,
+                concurrency_limit=CHAT_CONCURRENCY,
+                concurrency_id=CHAT_LANE
+            ).then(
+                fn=self._finalize_markdown,
+                inputs=[],
+                outputs=[chatbot],
+                queue=False
             ).then(
                 lambda: "",  # 清空输入框
                 inputs=[],
@@ -1146,17 +1421,19 @@ class GradioRAGApp:
             clear_btn.click(
                 fn=self.clear_chat,
                 inputs=[],
-                outputs=[chatbot, question_status]
+                outputs=[chatbot, question_status],
+                concurrency_limit=1,
+                concurrency_id=SESSION_LANE
             )
             
             # 历史记录管理事件绑定
             
             # 会话Radio选择事件（自动加载会话）
-            def on_session_radio_change(selected_option):
-                if selected_option and hasattr(self, '_session_option_map'):
+            def on_session_radio_change(session_id):
+                if session_id:
                     try:
-                        session_id = self._session_option_map.get(selected_option)
-                        if session_id:
+                        session = self._load_sessions(20, self.get_current_user_id())[1].get(session_id)
+                        if session:
                             # 自动加载会话历史
                             history, load_status = self.get_session_history(session_id)
                             details = self.get_session_details(session_id)
@@ -1167,12 +1444,12 @@ class GradioRAGApp:
                                 details,  # session_details  
                                 session_id,  # selected_session_id
                                 gr.update(visible=True),  # session_action_row
-                                f"✅ 已自动加载会话: {selected_option.split('|')[0].strip()}"  # history_status
+                                f"✅ 已自动加载会话: 🔸 {session['session_name']}"  # history_status
                             )
                         else:
                             return [], "❌ 会话ID未找到", "", gr.update(visible=False), "❌ 会话ID未找到"
                     except Exception as e:
-                        logger.error(f"选择会话失败: {e}")
+                        logger.error("选择会话失败: %s", e)
                         return [], "❌ 选择会话失败", "", gr.update(visible=False), "❌ 选择会话失败"
                 
                 # 没有选择时隐藏操作区域
@@ -1181,13 +1458,15 @@ class GradioRAGApp:
             sessions_radio.change(
                 fn=on_session_radio_change,
                 inputs=[sessions_radio],
-                outputs=[chatbot, session_details, selected_session_id, session_action_row, history_status]
+                outputs=[chatbot, session_details, selected_session_id, session_action_row, history_status],
+                concurrency_limit=1,
+                concurrency_id=SESSION_LANE
             )
             
             # 删除会话
             def handle_delete_session(session_id):
                 if not session_id:
-                    return "❌ 请先选择一个会话", gr.update(), "请从上方列表中选择一个会话", "", gr.update(visible=False)
+                    return "❌ 请先选择一个会话", gr.update(), _SELECT_SESSION_HINT, "", gr.update(visible=False)
                 
                 status = self.delete_session_by_id(session_id)
                 # 刷新会话列表
@@ -1195,7 +1474,7 @@ class GradioRAGApp:
                 return (
                     status,  # history_status
                     gr.update(choices=options, value=None),  # sessions_radio
-                    "请从上方列表中选择一个会话",  # session_details
+                    _SELECT_SESSION_HINT,  # session_details
                     "",  # selected_session_id
                     gr.update(visible=False)  # session_action_row
                 )
@@ -1203,7 +1482,9 @@ class GradioRAGApp:
             delete_session_btn.click(
                 fn=handle_delete_session,
                 inputs=[selected_session_id],
-                outputs=[history_status, sessions_radio, session_details, selected_session_id, session_action_row]
+                outputs=[history_status, sessions_radio, session_details, selected_session_id, session_action_row],
+                concurrency_limit=1,
+                concurrency_id=SESSION_LANE
             )
             
             # 搜索历史（按回车键搜索）
@@ -1224,6 +1505,9 @@ class GradioRAGApp:
         # 使用 Gradio 的 api 参数来挂载自定义路由
         logger.info("准备挂载GitHub OAuth路由")
         
+        # 启用队列：流式回答需要队列；修改共享状态的事件按 INGEST_LANE/SESSION_LANE/CHAT_LANE 分通道执行，其余只读事件可并发
+        app.queue(default_concurrency_limit=2, max_size=32)
+        
         return app
     
     def check_and_update_user_from_request(self, request) -> bool:
@@ -1238,7 +1522,7 @@ class GradioRAGApp:
                 return True
             return False
         except Exception as e:
-            logger.error(f"检查用户状态失败: {e}")
+            logger.error("检查用户状态失败: %s", e)
             return False
 
 def main():
@@ -3,22 +3,37 @@
 由于Gradio路由挂载的复杂性，我们创建一个独立的FastAPI应用来处理OAuth
 """
 
+import asyncio
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from github_auth import auth_router
+from github_auth import auth_router, github_auth, JWTAuthMiddleware
 import logging
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时在后台预热GitHub连接，退出时关闭共享的HTTP客户端"""
+    warmup_task = asyncio.create_task(github_auth.warmup()) if github_auth.is_configured() else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await github_auth.close()
+
 def create_oauth_app():
     """创建OAuth处理应用"""
     app = FastAPI(
         title="GitHub OAuth Handler",
-        description="GitHub OAuth 认证处理服务"
+        description="GitHub OAuth 认证处理服务",
+        lifespan=lifespan
     )
     
+    # 认证中间件：每个请求只解析并验证一次JWT cookie
+    app.add_middleware(JWTAuthMiddleware)
+    
     # 挂载OAuth路由
     app.include_router(auth_router)
     
@@ -12,10 +12,13 @@ import hashlib
 import pickle
 import logging
 import tempfile
+import threading
+import uuid
 from pathlib import Path
-from typing import Tuple, Optional, List, Dict, Any, Union
+from typing import Tuple, Optional, List, Dict, Any, Union, Iterator
 from dataclasses import dataclass
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -40,6 +43,8 @@ class Config:
     LLM_TEMPERATURE: float = 0.1
     BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     VECTOR_STORE_TYPE: str = "chroma"  # "chroma" or "faiss"
+    LOAD_MAX_WORKERS: int = 4  # 批量添加文档时并发解析PDF的线程数
+    CHROMA_ADD_BATCH_SIZE: int = 5000  # 批量添加文档时单次写入ChromaDB的文本块数（低于本地客户端的单次写入上限）
 
 config = Config()
 
@@ -57,11 +62,38 @@ class QianwenPaperQAAPI:
         self.document_info: Dict[str, Any] = {}
         self.vector_store: Optional[Union[FAISS, Chroma]] = None
         self.embeddings = None
+        # add_document 可在多个线程中并发调用，保护 document_info 的更新
+        self._doc_info_lock = threading.Lock()
+        # 嵌入对象只创建一次，后台预热和文档处理可能同时请求
+        self._embeddings_lock = threading.Lock()
         
         # 设置环境变量供OpenAI兼容接口使用
         os.environ["OPENAI_API_KEY"] = self.api_key
         os.environ["OPENAI_BASE_URL"] = config.BASE_URL
     
+    def _ensure_embeddings(self) -> CustomQwenEmbeddings:
+        """获取嵌入对象，首次调用时创建"""
+        with self._embeddings_lock:
+            if self.embeddings is None:
+                self.embeddings = CustomQwenEmbeddings(
+                    api_key=self.api_key,
+                    model=config.EMBEDDING_MODEL
+                )
+            return self.embeddings
+    
+    def warmup(self) -> None:
+        """
+        预热嵌入接口：创建嵌入对象并发送一次极短的请求，提前建立HTTPS连接
+        
+        供界面在初始化API后于后台线程调用，失败只记录警告，首次上传时会正常重试
+        """
+        try:
+            start_time = time.time()
+            self._ensure_embeddings().embed_query("warmup")
+            logger.info(f"嵌入接口预热完成，耗时: {time.time() - start_time:.2f}秒")
+        except Exception as e:
+            logger.warning(f"嵌入接口预热失败: {e}")
+    
     def get_file_hash(self, file_path: str) -> str:
         """计算文件的MD5哈希值"""
         if not os.path.exists(file_path):
@@ -277,14 +309,11 @@ class QianwenPaperQAAPI:
             pdf_hash = self.get_file_hash(pdf_path)
             logger.info(f"PDF哈希: {pdf_hash}")
             
-            # 创建嵌入对象
-            self.embeddings = CustomQwenEmbeddings(
-                api_key=self.api_key,
-                model=config.EMBEDDING_MODEL
-            )
+            # 获取嵌入对象（复用预热时已建立的连接）
+            embeddings = self._ensure_embeddings()
             
             # 尝试加载缓存的嵌入
-            vector_store, cached_metadata = self.load_embeddings_cache(pdf_hash, self.embeddings)
+            vector_store, cached_metadata = self.load_embeddings_cache(pdf_hash, embeddings)
             
             chunks_count = 0
             pages_count = 0
@@ -327,7 +356,7 @@ class QianwenPaperQAAPI:
                 } for doc in chunks]
                 
                 vector_store = self.create_vector_store_with_batches(
-                    all_texts, all_metadatas, self.embeddings, config.BATCH_SIZE, config.MAX_RETRIES, pdf_hash
+                    all_texts, all_metadatas, embeddings, config.BATCH_SIZE, config.MAX_RETRIES, pdf_hash
                 )
                 
                 # 保存嵌入缓存
@@ -430,6 +459,30 @@ class QianwenPaperQAAPI:
                 'processing_time': 0
             }
     
+    def ask_question_stream(self, question: str) -> Iterator[str]:
+        """
+        流式询问问题，逐段返回回答文本
+        
+        检索与提示词拼接与 ask_question 使用同一条RAG链，只有LLM调用改为流式；出错时直接抛出异常
+        """
+        if not self.qa_chain:
+            raise ValueError('请先上传并处理PDF文档')
+        
+        if not question or not question.strip():
+            raise ValueError('问题不能为空')
+        
+        question = question.strip()
+        logger.info(f"流式处理问题: {question}")
+        
+        docs = self.qa_chain.retriever.invoke(question)
+        combine_chain = self.qa_chain.combine_documents_chain
+        inputs = combine_chain._get_inputs(docs, question=question)
+        llm_chain = combine_chain.llm_chain
+        prompt = llm_chain.prompt.format_prompt(**inputs)
+        for chunk in llm_chain.llm.stream(prompt):
+            if chunk.content:
+                yield chunk.content
+    
     def get_document_summary(self) -> Dict[str, Any]:
         """获取文档摘要"""
         if not self.qa_chain:
@@ -453,110 +506,146 @@ class QianwenPaperQAAPI:
         """
         向现有向量存储中添加新文档（仅支持ChromaDB）
         """
+        return self.add_documents_bulk([(pdf_path, original_filename)])[0]
+    
+    def _load_and_split(self, pdf_path: str, original_filename: str = None) -> Tuple[List[str], List[dict], int]:
+        """加载并分块单个PDF，返回 (文本列表, 元数据列表, 页数)"""
+        self.validate_pdf_file(pdf_path)
+        
+        # 加载PDF文档
+        loader = PyPDFLoader(pdf_path)
+        documents = loader.load()
+        
+        if not documents:
+            raise ValueError("PDF文档为空或无法读取")
+        
+        pages_count = len(documents)
+        logger.info(f"PDF加载完成，共 {pages_count} 个文档页面")
+        
+        # 文档分块
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP
+        )
+        chunks = text_splitter.split_documents(documents)
+        
+        if not chunks:
+            raise ValueError("文档分块失败")
+        
+        logger.info(f"文档分块完成，共 {len(chunks)} 个文本块")
+        
+        all_texts = [doc.page_content for doc in chunks]
+        all_metadatas = [{
+            **doc.metadata,
+            'source_file': original_filename or os.path.basename(pdf_path),
+            'added_at': time.time()
+        } for doc in chunks]
+        return all_texts, all_metadatas, pages_count
+    
+    def add_documents_bulk(self, paths_and_names: List[Tuple[str, Optional[str]]]) -> List[Dict[str, Any]]:
+        """
+        批量向现有向量存储中添加文档（仅支持ChromaDB）
+        
+        先解析并分块全部PDF，合并所有文本块后按 CHROMA_ADD_BATCH_SIZE 分批写入集合
+        （通常只需一批），避免逐个文档写入的开销。
+        返回与输入顺序一致的逐文件结果，单个文件解析失败不影响其他文件。
+        """
         if config.VECTOR_STORE_TYPE != "chroma":
-            return {
+            return [{
                 'success': False,
                 'message': '动态更新仅支持ChromaDB，请在配置中设置VECTOR_STORE_TYPE="chroma"',
                 'document_info': None
-            }
+            } for _ in paths_and_names]
         
         if not self.vector_store or not isinstance(self.vector_store, Chroma):
-            return {
+            return [{
                 'success': False,
                 'message': '请先初始化一个文档再添加新文档',
                 'document_info': None
-            }
-            
-        try:
-            self.validate_pdf_file(pdf_path)
-            logger.info(f"开始添加新文档: {pdf_path}")
-            start_time = time.time()
-            
-            # 加载PDF文档
-            loader = PyPDFLoader(pdf_path)
-            documents = loader.load()
-            
-            if not documents:
-                raise ValueError("PDF文档为空或无法读取")
-            
-            pages_count = len(documents)
-            logger.info(f"PDF加载完成，共 {pages_count} 个文档页面")
-            
-            # 文档分块
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=config.CHUNK_SIZE,
-                chunk_overlap=config.CHUNK_OVERLAP
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            if not chunks:
-                raise ValueError("文档分块失败")
-            
-            chunks_count = len(chunks)
-            logger.info(f"文档分块完成，共 {chunks_count} 个文本块")
-            
-            # 添加到现有向量存储
-            all_texts = [doc.page_content for doc in chunks]
-            all_metadatas = [{
-                **doc.metadata,
-                'source_file': original_filename or os.path.basename(pdf_path),
-                'added_at': time.time()
-            } for doc in chunks]
-            
-            # 分批添加文档以避免 API 限制
-            batch_size = config.BATCH_SIZE
-            total_batches = (len(all_texts) + batch_size - 1) // batch_size
-            
-            for i in range(0, len(all_texts), batch_size):
-                batch_texts = all_texts[i:i+batch_size]
-                batch_metadatas = all_metadatas[i:i+batch_size]
-                batch_num = i // batch_size + 1
-                
-                logger.info(f"添加批次 {batch_num}/{total_batches}...")
-                
-                # 生成批次IDs
-                batch_ids = [f"add_{int(time.time())}_{i+j}" for j in range(len(batch_texts))]
-                
-                self.vector_store.add_texts(
-                    texts=batch_texts, 
-                    metadatas=batch_metadatas,
-                    ids=batch_ids
-                )
-            
-            logger.info(f"文档已添加到向量存储")
-            
-            # 更新文档信息
-            processing_time = time.time() - start_time
-            added_doc_info = {
-                'file_name': original_filename or os.path.basename(pdf_path),
-                'file_path': pdf_path,
-                'pages_count': pages_count,
-                'chunks_count': chunks_count,
-                'processing_time': processing_time,
-                'timestamp': time.time()
-            }
-            
+            } for _ in paths_and_names]
+        
+        if not paths_and_names:
+            return []
+        
+        start_time = time.time()
+        logger.info(f"开始添加 {len(paths_and_names)} 个新文档")
+        
+        def load(item):
+            try:
+                return self._load_and_split(*item)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=min(config.LOAD_MAX_WORKERS, len(paths_and_names))) as executor:
+            parsed = list(executor.map(load, paths_and_names))
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(paths_and_names)
+        loaded = []  # (输入位置, 文件路径, 文件名, 页数, 文本块数)
+        ids, texts, metadatas = [], [], []
+        for index, ((pdf_path, original_filename), item) in enumerate(zip(paths_and_names, parsed)):
+            if isinstance(item, Exception):
+                logger.error(f"添加文档失败: {item}")
+                results[index] = {
+                    'success': False,
+                    'message': f'添加文档失败: {str(item)}',
+                    'document_info': None
+                }
+                continue
+            
+            file_texts, file_metadatas, pages_count = item
+            # ID前缀包含随机部分：同一秒内添加的多个文档不会产生重复ID
+            id_prefix = f"add_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+            ids.extend(f"{id_prefix}_{j}" for j in range(len(file_texts)))
+            texts.extend(file_texts)
+            metadatas.extend(file_metadatas)
+            loaded.append((index, pdf_path, original_filename or os.path.basename(pdf_path), pages_count, len(file_texts)))
+        
+        if texts:
+            try:
+                logger.info(f"生成并写入 {len(texts)} 个文本块的嵌入...")
+                batch_size = config.CHROMA_ADD_BATCH_SIZE
+                for i in range(0, len(texts), batch_size):
+                    self.vector_store.add_texts(
+                        texts=texts[i:i + batch_size],
+                        metadatas=metadatas[i:i + batch_size],
+                        ids=ids[i:i + batch_size]
+                    )
+                logger.info(f"文档已添加到向量存储")
+            except Exception as e:
+                logger.error(f"添加文档失败: {e}")
+                for index, *_ in loaded:
+                    results[index] = {
+                        'success': False,
+                        'message': f'添加文档失败: {str(e)}',
+                        'document_info': None
+                    }
+                return results
+        
+        # 更新文档信息
+        processing_time = time.time() - start_time
+        with self._doc_info_lock:
             # 如果有多个文档，将其存储在列表中
             if 'documents' not in self.document_info:
                 self.document_info['documents'] = [self.document_info.copy()] if self.document_info else []
-                
-            self.document_info['documents'].append(added_doc_info)
-            
-            logger.info(f"文档添加完成，总耗时: {processing_time:.2f}秒")
             
-            return {
-                'success': True,
-                'message': '文档添加成功',
-                'document_info': added_doc_info
-            }
-            
-        except Exception as e:
-            logger.error(f"添加文档失败: {e}")
-            return {
-                'success': False,
-                'message': f'添加文档失败: {str(e)}',
-                'document_info': None
-            }
+            for index, pdf_path, file_name, pages_count, chunks_count in loaded:
+                added_doc_info = {
+                    'file_name': file_name,
+                    'file_path': pdf_path,
+                    'pages_count': pages_count,
+                    'chunks_count': chunks_count,
+                    'processing_time': processing_time,
+                    'timestamp': time.time()
+                }
+                self.document_info['documents'].append(added_doc_info)
+                results[index] = {
+                    'success': True,
+                    'message': '文档添加成功',
+                    'document_info': added_doc_info
+                }
+        
+        logger.info(f"文档添加完成，总耗时: {processing_time:.2f}秒")
+        return results
     
     def delete_document_by_source(self, source_file: str) -> Dict[str, Any]:
         """
@@ -0,0 +1,34 @@
+import os
+from dotenv import load_dotenv
+
+
+def main():
+    # 调试脚本会直接请求接口，导入本模块时不执行
+    import dashscope
+
+    # Load environment variables
+    load_dotenv()
+
+    # Set the API key
+    dashscope.api_key = os.environ.get('DASHSCOPE_API_KEY')
+
+    print(f"API Key loaded: {bool(dashscope.api_key)}")
+
+    try:
+        from dashscope import Generation
+        
+        response = Generation.call(
+            model='qwen-turbo',
+            prompt='Hello, how are you?',
+            max_tokens=100
+        )
+        
+        print(f"Response: {response}")
+        
+    except Exception as e:
+        print(f"Error: {e}")
+        print(f"Error type: {type(e)}")
+
+
+if __name__ == "__main__":
+    main()
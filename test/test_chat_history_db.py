@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+聊天历史数据库测试：旧版数据库迁移、消息计数、全文搜索、级联删除、API密钥加解密和读缓存
+
+运行方式（项目根目录）：python -m pytest test/test_chat_history_db.py
+"""
+import base64
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import chat_history_db
+from chat_history_db import ChatHistoryDB
+
+# 初始版本的表结构（无消息计数列、无级联删除、无全文索引、无 user_version）
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    name TEXT,
+    email TEXT,
+    avatar_url TEXT,
+    dashscope_api_key TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    session_name TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    document_info TEXT,
+    vector_store_type TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+CREATE TABLE chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    role TEXT,
+    content TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processing_time REAL,
+    document_sources TEXT,
+    FOREIGN KEY (session_id) REFERENCES chat_sessions (session_id)
+);
+CREATE INDEX idx_messages_session ON chat_messages(session_id);
+CREATE INDEX idx_messages_timestamp ON chat_messages(timestamp);
+CREATE INDEX idx_sessions_updated ON chat_sessions(updated_at);
+CREATE INDEX idx_users_username ON users(username);
+CREATE INDEX idx_sessions_user ON chat_sessions(user_id);
+"""
+
+
+@pytest.fixture
+def db_dir(tmp_path):
+    """预先写入加密密钥文件，避免每个测试都执行一次scrypt派生"""
+    (tmp_path / "encryption.key").write_bytes(Fernet.generate_key())
+    return tmp_path
+
+
+@pytest.fixture
+def baseline_db(db_dir):
+    """按初始版本结构和编码方式写入数据的数据库文件，其中包含一条孤立消息"""
+    path = db_dir / "chat_history.db"
+    key = (db_dir / "encryption.key").read_bytes()
+    # 初始版本在Fernet令牌外又包了一层base64
+    legacy_key = base64.urlsafe_b64encode(Fernet(key).encrypt(b"sk-legacy")).decode()
+
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (user_id, username, name, dashscope_api_key) VALUES (7, 'bob', 'Bob', ?)", (legacy_key,))
+    conn.execute("""
+        INSERT INTO chat_sessions (session_id, user_id, session_name, document_info, vector_store_type)
+        VALUES ('s1', 7, '关于 z.pdf 的对话', '{"file_name": "z.pdf"}', 'chroma')
+    """)
+    conn.executemany(
+        "INSERT INTO chat_messages (session_id, role, content) VALUES (?, ?, ?)",
+        [
+            ('s1', 'user', '这篇论文的研究方法是什么'),
+            ('s1', 'assistant', '论文采用了检索增强生成方法'),
+            ('s1', 'user', 'legacy question'),
+            ('gone', 'user', '会话已不存在的孤立消息'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def migrated(baseline_db):
+    db = ChatHistoryDB(str(baseline_db))
+    yield db
+    db.close()
+
+
+def test_migration_sets_schema_version(migrated, baseline_db):
+    conn = sqlite3.connect(baseline_db)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == chat_history_db._SCHEMA_VERSION
+        fks = conn.execute("PRAGMA foreign_key_list(chat_messages)").fetchall()
+        assert any(fk[2] == 'chat_sessions' and fk[6] == 'CASCADE' for fk in fks)
+    finally:
+        conn.close()
+
+
+def test_migration_keeps_orphans_in_backup_table(migrated, baseline_db):
+    conn = sqlite3.connect(baseline_db)
+    try:
+        orphans = conn.execute("SELECT session_id, content FROM chat_messages_orphans").fetchall()
+    finally:
+        conn.close()
+    assert orphans == [('gone', '会话已不存在的孤立消息')]
+
+
+def test_migration_backfills_counts(migrated):
+    sessions = migrated.get_recent_sessions(user_id=7)
+    assert [s['session_id'] for s in sessions] == ['s1']
+    assert sessions[0]['message_count'] == 3
+
+    stats = migrated.get_session_stats()
+    assert stats['total_sessions'] == 1
+    assert stats['total_messages'] == 3
+
+
+def test_migration_indexes_existing_messages(migrated):
+    # 3个字符及以上走全文索引，更短的关键词回退到LIKE
+    assert [m['content'] for m in migrated.search_messages('研究方法')] == ['这篇论文的研究方法是什么']
+    assert len(migrated.search_messages('legacy')) == 1
+    assert len(migrated.search_messages('方法')) == 2
+
+    previews = migrated.search_messages_preview('检索增强', user_id=7)
+    assert len(previews) == 1
+    assert '**' in previews[0]['preview']
+
+
+def test_migration_rewrites_legacy_api_key(migrated, baseline_db):
+    assert migrated.get_user_api_key(7) == 'sk-legacy'
+    conn = sqlite3.connect(baseline_db)
+    try:
+        stored = conn.execute("SELECT dashscope_api_key FROM users WHERE user_id = 7").fetchone()[0]
+    finally:
+        conn.close()
+    assert stored.startswith('gAAAAA')
+
+
+def test_reopen_skips_migration(migrated, baseline_db, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("结构已是最新版本时不应再次迁移")
+
+    monkeypatch.setattr(ChatHistoryDB, '_rebuild_messages_table', fail)
+    monkeypatch.setattr(ChatHistoryDB, '_init_stats', fail)
+    db = ChatHistoryDB(str(baseline_db))
+    try:
+        assert db.get_session_stats()['total_messages'] == 3
+        assert len(db.search_messages('legacy')) == 1
+    finally:
+        db.close()
+
+
+def test_failed_migration_rolls_back(baseline_db, monkeypatch):
+    def crash(self, cursor):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(ChatHistoryDB, '_init_stats', crash)
+    with pytest.raises(RuntimeError):
+        ChatHistoryDB(str(baseline_db))
+
+    conn = sqlite3.connect(baseline_db)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_sessions)")]
+        assert 'message_count' not in columns
+        assert conn.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0] == 4
+    finally:
+        conn.close()
+
+    monkeypatch.undo()
+    db = ChatHistoryDB(str(baseline_db))
+    try:
+        assert db.get_session_stats()['total_messages'] == 3
+    finally:
+        db.close()
+
+
+def test_new_messages_update_counts_and_index(migrated):
+    migrated.add_message('s1', 'assistant', 'a brand new answer', processing_time=1.5)
+    migrated.add_messages([
+        ('s1', 'user', 'follow up question', None, None),
+        ('s1', 'assistant', 'follow up answer', 0.5, ['z.pdf']),
+    ])
+
+    assert migrated.get_recent_sessions()[0]['message_count'] == 6
+    assert migrated.get_session_stats()['total_messages'] == 6
+    assert len(migrated.search_messages('follow up')) == 2
+
+    messages = migrated.get_session_messages('s1')
+    assert [m['content'] for m in messages[-2:]] == ['follow up question', 'follow up answer']
+    assert messages[-1]['document_sources'] == ['z.pdf']
+
+
+def test_delete_session_cascades(migrated):
+    assert migrated.delete_session('s1')
+
+    assert migrated.get_session_messages('s1') == []
+    assert migrated.get_recent_sessions() == []
+    assert migrated.search_messages('legacy') == []
+    assert migrated.search_messages('方法') == []
+    stats = migrated.get_session_stats()
+    assert stats['total_sessions'] == 0
+    assert stats['total_messages'] == 0
+
+
+def test_api_key_round_trip(db_dir):
+    db = ChatHistoryDB(str(db_dir / "chat_history.db"))
+    try:
+        assert db.upsert_user(1, 'alice', 'Alice')
+        assert db.get_user_api_key(1) in (None, '')
+
+        assert db.update_user_api_key(1, 'sk-new')
+        assert db.get_user_api_key(1) == 'sk-new'
+
+        # 只更新基本信息时保留已保存的密钥
+        assert db.upsert_user(1, 'alice', 'Alice Liddell')
+        assert db.get_user_api_key(1) == 'sk-new'
+
+        assert db.update_user_api_key(1, '')
+        assert not db.get_user_api_key(1)
+    finally:
+        db.close()
+
+
+def test_cached_results_are_copies(migrated):
+    messages = migrated.get_session_messages('s1')
+    messages[0]['content'] = 'changed'
+    messages.append({})
+    sessions = migrated.get_recent_sessions()
+    sessions[0]['session_name'] = 'changed'
+
+    assert migrated.get_session_messages('s1')[0]['content'] == '这篇论文的研究方法是什么'
+    assert len(migrated.get_session_messages('s1')) == 3
+    assert migrated.get_recent_sessions()[0]['session_name'] == '关于 z.pdf 的对话'
+
+
+def test_cache_sees_writes_from_other_connections(migrated, baseline_db):
+    assert len(migrated.get_session_messages('s1')) == 3
+
+    other = ChatHistoryDB(str(baseline_db))
+    try:
+        other.add_message('s1', 'user', 'written elsewhere')
+    finally:
+        other.close()
+
+    assert len(migrated.get_session_messages('s1')) == 4
+    assert migrated.get_recent_sessions()[0]['message_count'] == 4
+
+
+def test_api_key_cache_is_bounded(db_dir, monkeypatch):
+    monkeypatch.setattr(chat_history_db, '_API_KEY_CACHE_SIZE', 2)
+    db = ChatHistoryDB(str(db_dir / "chat_history.db"))
+    try:
+        for user_id in (1, 2, 3):
+            db.upsert_user(user_id, f'user{user_id}', dashscope_api_key=f'sk-{user_id}')
+            assert db.get_user_api_key(user_id) == f'sk-{user_id}'
+        assert list(db._api_key_cache) == [2, 3]
+
+        assert db.update_user_api_key(2, 'sk-changed')
+        assert db.get_user_api_key(2) == 'sk-changed'
+        assert db.get_user_api_key(1) == 'sk-1'
+    finally:
+        db.close()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+GitHub 认证模块测试：从请求中获取当前用户、JWT令牌校验及缓存、OAuth state 存储
+
+运行方式（项目根目录）：python -m pytest test/test_github_auth.py
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_auth as auth
+from github_auth import GitHubAuth, StateStore, github_auth, get_current_user
+
+USER = {"id": 7, "login": "bob", "name": "Bob"}
+
+
+class WrappedRequest:
+    """模拟 gr.Request：通过 __getattr__ 代理底层请求，字典属性经过JSON往返"""
+
+    def __init__(self, request):
+        self.request = request
+
+    def __getattr__(self, name):
+        value = getattr(self.request, name)
+        if isinstance(value, dict):
+            # scope 中含有bytes，和 gr.Request 一样在这里抛出 TypeError
+            return json.loads(json.dumps(value))
+        return value
+
+
+def make_request(*cookies, state=None):
+    headers = [(b"host", b"localhost")]
+    headers.extend((b"cookie", cookie.encode()) for cookie in cookies)
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+    if state is not None:
+        scope["state"] = state
+    return Request(scope)
+
+
+@pytest.fixture
+def token():
+    return github_auth.create_jwt_token(USER)
+
+
+def test_current_user_from_cookie(token):
+    user = get_current_user(make_request(f"theme=dark; access_token={token}"))
+    assert user["user_id"] == 7
+    assert user["username"] == "bob"
+
+
+def test_current_user_from_later_cookie_header(token):
+    # HTTP/2 下cookie可能分散在多个请求头中
+    request = make_request("theme=dark", f"access_token={token}")
+    assert get_current_user(request)["username"] == "bob"
+    assert get_current_user(WrappedRequest(request))["username"] == "bob"
+
+
+def test_current_user_from_middleware_state(token):
+    # 中间件已写入结果时不再读取cookie
+    request = make_request(f"access_token={token}", state={"user": None})
+    assert get_current_user(request) is None
+
+
+def test_current_user_from_wrapped_request(token):
+    request = WrappedRequest(make_request(f"access_token={token}", state={"user": None}))
+    with pytest.raises(TypeError):
+        request.scope
+    assert get_current_user(request)["username"] == "bob"
+
+
+def test_current_user_without_token():
+    assert get_current_user(make_request()) is None
+    assert get_current_user(WrappedRequest(make_request("theme=dark"))) is None
+    assert get_current_user(make_request("access_token=garbage")) is None
+
+
+class FakeClock:
+    """替换 github_auth 模块中的 time，time() 和 monotonic() 共用一个可拨动的时钟"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(auth, "time", SimpleNamespace(time=clock, monotonic=clock))
+    return clock
+
+
+def count_decodes(monkeypatch):
+    calls = []
+    decode = auth.jwt.decode
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting)
+    return calls
+
+
+def test_verify_valid_token(token):
+    payload = GitHubAuth().verify_jwt_token(token)
+    assert payload["user_id"] == 7
+    assert payload["name"] == "Bob"
+    assert payload["exp"] - payload["iat"] == auth.JWT_EXPIRE_HOURS * 3600
+
+
+def test_verify_rejects_bad_tokens(token, monkeypatch):
+    verifier = GitHubAuth()
+    expired = auth.jwt.encode({"user_id": 7, "exp": int(time.time()) - 10, "pad": "x" * 80},
+                              auth.JWT_SECRET_KEY, algorithm=auth.JWT_ALGORITHM)
+    no_exp = auth.jwt.encode({"user_id": 7, "pad": "x" * 80}, auth.JWT_SECRET_KEY, algorithm=auth.JWT_ALGORITHM)
+    forged = auth.jwt.encode({"user_id": 7, "exp": int(time.time()) + 60, "pad": "x" * 80},
+                             "not-the-secret", algorithm=auth.JWT_ALGORITHM)
+    calls = count_decodes(monkeypatch)
+    for bad in (expired, no_exp, forged, token[:-2] + "xx"):
+        assert verifier.verify_jwt_token(bad) is None
+    # 结构合法的令牌都经过签名和过期校验，失败结果不进入缓存
+    assert len(calls) == 4
+    assert len(verifier._jwt_cache) == 0
+
+
+def test_verify_fast_rejects_malformed_tokens(token, monkeypatch):
+    calls = count_decodes(monkeypatch)
+    verifier = GitHubAuth()
+    for bad in ("", "garbage", token[:auth.JWT_MIN_LENGTH - 1], "eyJ" + "a" * auth.JWT_MAX_LENGTH,
+                token.replace(".", "", 1), "x" + token[1:]):
+        assert verifier.verify_jwt_token(bad) is None
+    assert calls == []
+
+
+def test_verify_caches_valid_tokens(token, monkeypatch):
+    calls = count_decodes(monkeypatch)
+    verifier = GitHubAuth()
+    first = verifier.verify_jwt_token(token)
+    first["username"] = "changed"
+    assert verifier.verify_jwt_token(token)["username"] == "bob"
+    assert len(calls) == 1
+
+
+def test_verify_drops_expired_cache_entries(monkeypatch, clock):
+    token = github_auth.create_jwt_token(USER)
+    verifier = GitHubAuth()
+    assert verifier.verify_jwt_token(token) is not None
+
+    calls = count_decodes(monkeypatch)
+    clock.now += auth.JWT_EXPIRE_HOURS * 3600 + 1
+    # 缓存中的条目已过期，重新交由 jwt.decode 校验（其时钟未被替换，令牌本身仍有效）
+    assert verifier.verify_jwt_token(token) is not None
+    assert len(calls) == 1
+
+
+def test_verify_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(auth, "JWT_CACHE_SIZE", 2)
+    verifier = GitHubAuth()
+    tokens = [github_auth.create_jwt_token({"id": i, "login": f"user{i}"}) for i in range(3)]
+    for t in tokens:
+        assert verifier.verify_jwt_token(t) is not None
+    assert len(verifier._jwt_cache) == 2
+
+
+def test_state_store_add_and_pop(clock):
+    store = StateStore(ttl=10, maxsize=10)
+    store.add("a")
+    assert "a" in store
+    assert "b" not in store
+    assert store.pop("a") is not None
+    assert "a" not in store
+    assert store.pop("a") is None
+
+
+def test_state_store_expires_entries(clock):
+    store = StateStore(ttl=10, maxsize=10)
+    store.add("a")
+    clock.now += 5
+    store.add("b")
+    clock.now += 6
+    assert "a" not in store
+    assert "b" in store
+
+    # 写入时清理已过期的条目
+    store.add("c")
+    assert len(store) == 2
+
+
+def test_state_store_drops_oldest_when_full(clock):
+    store = StateStore(ttl=10, maxsize=3)
+    for state in "abcd":
+        store.add(state)
+    assert len(store) == 3
+    assert "a" not in store
+    assert all(state in store for state in "bcd")